@@ -0,0 +1,146 @@
+from os import listdir, makedirs, remove
+from os.path import exists
+from PIL import Image
+import io
+import json
+import numpy as np
+
+from scanManifest import parseCardFileName
+from instrumentation import Stage
+
+IMAGES_FILE = 'images.npy'
+LABELS_FILE = 'labels.npy'
+NAMES_FILE = 'names.json'
+META_FILE = 'meta.json'
+
+def buildArtCache(artPath, jsonPath, cachePath, cutoffSize=500, seed=0):
+  '''
+  Decodes every card art file once into a contiguous uint8 image block with a matching label
+    array, stored on disk so training and demos can memory-map it instead of decoding again.
+    Records are written in a seeded random order so any contiguous slice is a random sample
+  Inputs:
+    artPath: path to card art directory
+    jsonPath: path to card info json file
+    cachePath: directory to store the dataset in
+    cutoffSize: minimum representation for a primary type to be valid (500)
+    seed: seed for the record order (0)
+  Outputs:
+    numRecords: number of images stored
+  '''
+  from utils import generateCardToSimpleTypeDict
+
+  cardNameToCategories, numCategories, typeToCategory = generateCardToSimpleTypeDict(jsonPath,
+                                                                                      cutoffSize)
+  artFiles = [art for art in sorted(listdir(artPath)) if not art.startswith('.')]
+  if not artFiles:
+    raise ValueError('No card art found in ' + artPath)
+  if not exists(cachePath):
+    makedirs(cachePath)
+  # Statistics of a previous build would not match the new images
+  from datasetStats import STATS_FILE
+  if exists(cachePath + '/' + STATS_FILE):
+    remove(cachePath + '/' + STATS_FILE)
+
+  shape = np.array(Image.open(artPath + artFiles[0])).shape
+  order = np.random.RandomState(seed).permutation(len(artFiles))
+  images = np.lib.format.open_memmap(cachePath + '/' + IMAGES_FILE, mode='w+', dtype=np.uint8,
+                                      shape=(len(artFiles),) + shape)
+  labels = np.empty(len(artFiles), dtype=np.int32)
+  names = [None] * len(artFiles)
+  files = [None] * len(artFiles)
+
+  with Stage('buildArtCache', total=len(artFiles)) as stage:
+    for index, art in zip(order, artFiles):
+      cardName = parseCardFileName(art)
+      with stage.step('decode'):
+        images[index] = np.asarray(Image.open(artPath + art), dtype=np.uint8)
+      labels[index] = cardNameToCategories.get(cardName, typeToCategory['Other'])
+      names[index] = cardName
+      files[index] = art
+      stage.tick()
+    images.flush()
+    del images
+
+  np.save(cachePath + '/' + LABELS_FILE, labels)
+  with io.open(cachePath + '/' + NAMES_FILE, 'w', encoding='utf-8') as namesFile:
+    json.dump({'names': names, 'files': files}, namesFile)
+  # Written last, its presence marks a complete cache
+  with io.open(cachePath + '/' + META_FILE, 'w', encoding='utf-8') as metaFile:
+    json.dump({'numCategories': numCategories, 'typeToCategory': typeToCategory,
+                'cutoffSize': cutoffSize, 'seed': seed, 'shape': list(shape)}, metaFile)
+  return len(artFiles)
+
+def artCacheExists(cachePath):
+  '''
+  Returns True if a complete art cache is stored at cachePath, False otherwise
+  Inputs:
+    cachePath: directory the dataset is stored in
+  '''
+  return exists(cachePath + '/' + META_FILE)
+
+def openArtCache(cachePath):
+  '''
+  Opens a stored art cache without reading the images into memory
+  Inputs:
+    cachePath: directory the dataset is stored in
+  Outputs:
+    images: read-only memory-mapped uint8 array of shape (numRecords, height, width, channels)
+    labels: array of primary type categories
+    names: list of card names
+    files: list of art file names
+    meta: dictionary with numCategories, typeToCategory, cutoffSize, seed, shape
+  '''
+  images = np.load(cachePath + '/' + IMAGES_FILE, mmap_mode='r')
+  labels = np.load(cachePath + '/' + LABELS_FILE)
+  with io.open(cachePath + '/' + NAMES_FILE, encoding='utf-8') as namesFile:
+    namesData = json.load(namesFile)
+  with io.open(cachePath + '/' + META_FILE, encoding='utf-8') as metaFile:
+    meta = json.load(metaFile)
+  return images, labels, namesData['names'], namesData['files'], meta
+
+def loadArtCache(cachePath, testProp=0.2):
+  '''
+  Splits a stored art cache into training and test/validation sets. The images stay memory-mapped
+    uint8, the split is a pair of views so nothing is copied
+  Inputs:
+    cachePath: directory the dataset is stored in
+    testProp: proportion of art to separate from training for test/validation (0.2)
+  Outputs:
+    X: training art arrays
+    Y: training category targets
+    X_Test: testing art arrays
+    Y_Test: testing category targets
+    numCategories: total number of valid categories
+  '''
+  images, labels, _, _, meta = openArtCache(cachePath)
+  numTest = int(len(images) * testProp)
+  numTrain = len(images) - numTest
+  return ((images[:numTrain], labels[:numTrain]), (images[numTrain:], labels[numTrain:]),
+            meta['numCategories'])
+
+def iterArtBatches(X, Y, numCategories, batchSize=100, shuffle=True, seed=None, augmentor=None):
+  '''
+  Yields float32 batches of art with onehot targets, converting from uint8 one batch at a time
+  Inputs:
+    X: uint8 art arrays, usually memory-mapped
+    Y: category targets
+    numCategories: total number of valid categories
+    batchSize: number of samples per batch (100)
+    shuffle: boolean for whether to visit samples in random order (True)
+    seed: seed for the shuffle order (None)
+    augmentor: function applied to every float32 image batch, e.g. a BatchAugmentor (None)
+  Outputs:
+    generator of (batchX, batchY) tuples
+  '''
+  indices = np.arange(len(X))
+  if shuffle:
+    np.random.RandomState(seed).shuffle(indices)
+  for start in range(0, len(indices), batchSize):
+    # Sorted indices keep memory-mapped reads mostly sequential
+    batchIndices = np.sort(indices[start:start + batchSize])
+    batchX = np.asarray(X[batchIndices], dtype=np.float32)
+    if augmentor is not None:
+      batchX = augmentor(batchX)
+    batchY = np.zeros((len(batchIndices), numCategories), dtype=np.float32)
+    batchY[np.arange(len(batchIndices)), np.asarray(Y)[batchIndices]] = 1
+    yield batchX, batchY
@@ -0,0 +1,293 @@
+from os import listdir, replace
+from os.path import exists, getmtime, getsize
+from PIL import Image
+import hashlib
+import io
+import json
+import numpy as np
+
+from instrumentation import Stage, logger
+
+CLUSTERS_FILE = '.artClusters.json'
+HASH_SIZE = 32
+HASH_BITS = 8
+DUPLICATE_MODES = (None, 'keepOne', 'splitByCluster')
+
+def dctMatrix(size):
+  '''
+  Returns the orthonormal DCT-II matrix of a given size
+  '''
+  k = np.arange(size)[:, None]
+  n = np.arange(size)[None, :]
+  matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2.0 / size)
+  matrix[0] /= np.sqrt(2.0)
+  return matrix
+
+def areaResizeMatrix(inputSize, outputSize):
+  '''
+  Returns the (outputSize, inputSize) matrix averaging every output pixel over its share of the
+    input, so a batch of images can be resized with two matrix products
+  '''
+  edges = np.arange(outputSize + 1) * inputSize / outputSize
+  pixels = np.arange(inputSize)
+  overlap = (np.minimum(edges[1:, None], pixels[None, :] + 1) -
+              np.maximum(edges[:-1, None], pixels[None, :]))
+  weights = np.maximum(overlap, 0)
+  return weights / weights.sum(axis=1, keepdims=True)
+
+def perceptualHashes(images, flipped=False):
+  '''
+  Computes 64 bit DCT perceptual hashes of a batch of images: each image is converted to
+    grayscale, area resized to 32x32 and transformed with a 2D DCT, and every bit of the hash says
+    whether one of the 8x8 lowest frequency coefficients is above their median
+  Inputs:
+    images: uint8 array of shape (numImages, height, width) or (numImages, height, width, channels)
+    flipped: boolean for whether to hash the horizontally flipped images instead (False)
+  Outputs:
+    hashes: uint64 array of numImages hashes
+  '''
+  images = np.asarray(images, dtype=np.float64)
+  if images.ndim == 4:
+    if images.shape[3] >= 3:
+      images = images[..., :3] @ np.array([0.299, 0.587, 0.114])
+    else:
+      images = images[..., 0]
+  if flipped:
+    images = images[:, :, ::-1]
+  rows = areaResizeMatrix(images.shape[1], HASH_SIZE)
+  columns = areaResizeMatrix(images.shape[2], HASH_SIZE)
+  dct = dctMatrix(HASH_SIZE)[:HASH_BITS]
+  # Resize and transform in one chain of matrix products over the whole batch
+  coefficients = np.einsum('ij,njk,lk->nil', dct @ rows, images, dct @ columns)
+  coefficients = coefficients.reshape(len(images), HASH_BITS * HASH_BITS)
+  bits = coefficients > np.median(coefficients, axis=1, keepdims=True)
+  return np.packbits(bits, axis=1).view('>u8')[:, 0].astype(np.uint64)
+
+def hammingDistances(a, b):
+  '''
+  Returns the number of differing bits between matching pairs of uint64 hashes
+  '''
+  xor = np.bitwise_xor(a, b).astype('>u8')
+  return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+def bandKeys(hashes, numBands):
+  '''
+  Splits every 64 bit hash into numBands bands of nearly equal width
+  Outputs:
+    keys: int64 array of shape (numBands, numHashes), the value of each band of each hash
+  '''
+  widths = np.full(numBands, 64 // numBands)
+  widths[:64 % numBands] += 1
+  shifts = 64 - np.cumsum(widths)
+  keys = np.empty((numBands, len(hashes)), dtype=np.int64)
+  for band in range(numBands):
+    mask = np.uint64((1 << int(widths[band])) - 1)
+    keys[band] = (hashes >> np.uint64(shifts[band])) & mask
+  return keys
+
+def candidatePairs(keys, maxBucketSize=256):
+  '''
+  Finds every pair of entries sharing the value of at least one band, without comparing all pairs.
+    Entries are grouped by band value and paired within each group. A group larger than
+    maxBucketSize is sorted by the other bands and every entry is only paired with the
+    maxBucketSize - 1 entries after it, so one crowded band value cannot make the pairs quadratic
+  Inputs:
+    keys: array of shape (numBands, numEntries) from bandKeys
+    maxBucketSize: largest group of equal band values whose entries are all paired (256)
+  Outputs:
+    pairs: int64 array of shape (numPairs, 2) of unique (i, j) entry pairs with i < j
+  '''
+  found = []
+  numEntries = keys.shape[1]
+  numCapped = 0
+  for bandKey in keys:
+    _, counts = np.unique(bandKey, return_counts=True)
+    # Sorted by band value first, so every group is contiguous and in np.unique's order, then by
+    # the full key so the nearest entries of a capped group are next to each other
+    order = np.lexsort(tuple(keys[::-1]) + (bandKey,))
+    starts = np.cumsum(counts) - counts
+    for size in np.unique(counts[counts > 1]):
+      groupStarts = starts[counts == size]
+      if size <= maxBucketSize:
+        members = order[groupStarts[:, None] + np.arange(size)]
+        firstIndex, secondIndex = np.triu_indices(size, 1)
+        first, second = members[:, firstIndex].ravel(), members[:, secondIndex].ravel()
+        found.append(np.minimum(first, second) * numEntries + np.maximum(first, second))
+        continue
+      numCapped += len(groupStarts)
+      for groupStart in groupStarts:
+        members = order[groupStart:groupStart + size]
+        for offset in range(1, maxBucketSize):
+          first, second = members[:-offset], members[offset:]
+          found.append(np.minimum(first, second) * numEntries + np.maximum(first, second))
+  if numCapped:
+    logger.warning('candidatePairs: %d band values shared by more than %d hashes, only their '
+                    'nearest entries were paired', numCapped, maxBucketSize)
+  if not found:
+    return np.empty((0, 2), dtype=np.int64)
+  codes = np.unique(np.concatenate(found))
+  return np.stack([codes // numEntries, codes % numEntries], axis=1)
+
+def clusterPairs(numItems, pairs):
+  '''
+  Groups items connected by pairs with a union-find
+  Inputs:
+    numItems: number of items
+    pairs: array of (i, j) item pairs
+  Outputs:
+    clusters: cluster number of every item, numbered from 0 in order of first member
+  '''
+  parents = list(range(numItems))
+
+  def find(item):
+    root = item
+    while parents[root] != root:
+      root = parents[root]
+    while parents[item] != root:
+      parents[item], item = root, parents[item]
+    return root
+
+  for i, j in pairs.tolist():
+    rootI, rootJ = find(i), find(j)
+    if rootI != rootJ:
+      parents[max(rootI, rootJ)] = min(rootI, rootJ)
+  roots = np.array([find(item) for item in range(numItems)], dtype=np.int64)
+  _, clusters = np.unique(roots, return_inverse=True)
+  return clusters
+
+def findDuplicates(hashes, maxDistance=4, numBands=None, flippedHashes=None, maxBucketSize=256):
+  '''
+  Clusters near-duplicate hashes. Identical hashes are linked directly, then candidates among the
+    distinct hashes come from multi-index hashing: hashes are split into bands and only hashes
+    sharing a band are compared. With numBands greater than maxDistance, two hashes within
+    maxDistance bits always share a band, so no near-duplicate is missed unless a band value is
+    shared by more than maxBucketSize distinct hashes
+  Inputs:
+    hashes: uint64 array of perceptual hashes
+    maxDistance: largest number of differing bits for two images to be duplicates (4)
+    numBands: number of bands, if None will be set to maxDistance + 1 (None)
+    flippedHashes: hashes of the horizontally flipped images, to also match mirrored copies (None)
+    maxBucketSize: largest number of distinct hashes sharing a band value that are all compared,
+      see candidatePairs (256)
+  Outputs:
+    clusters: cluster number of every hash
+    pairs: array of (i, j) duplicate pairs linking the clusters, every item with an identical
+      hash is paired with the first item with that hash rather than with each other
+  '''
+  if numBands is None:
+    numBands = maxDistance + 1
+  entryHashes = hashes
+  entryItems = np.arange(len(hashes))
+  if flippedHashes is not None:
+    entryHashes = np.concatenate([hashes, flippedHashes])
+    entryItems = np.concatenate([entryItems, entryItems])
+  uniqueHashes, firstEntries, inverse = np.unique(entryHashes, return_index=True,
+                                                    return_inverse=True)
+  firstItems = entryItems[firstEntries]
+  identical = np.stack([firstItems[inverse.ravel()], entryItems], axis=1)
+  candidates = candidatePairs(bandKeys(uniqueHashes, numBands), maxBucketSize)
+  close = hammingDistances(uniqueHashes[candidates[:, 0]],
+                            uniqueHashes[candidates[:, 1]]) <= maxDistance
+  items = np.concatenate([firstItems[candidates[close]], identical])
+  items = np.unique(np.sort(items[items[:, 0] != items[:, 1]], axis=1), axis=0)
+  return clusterPairs(len(hashes), items), items
+
+def hashArtDirectory(artPath, files, batchSize=1024):
+  '''
+  Decodes art files in batches and computes their perceptual hashes and flipped hashes
+  Inputs:
+    artPath: path to card art directory
+    files: art file names
+    batchSize: number of images per vectorized batch (1024)
+  Outputs:
+    hashes: uint64 array of hashes
+    flippedHashes: uint64 array of hashes of the flipped images
+  '''
+  hashes = np.empty(len(files), dtype=np.uint64)
+  flippedHashes = np.empty(len(files), dtype=np.uint64)
+  with Stage('hashArtDirectory', total=len(files)) as stage:
+    for start in range(0, len(files), batchSize):
+      batchFiles = files[start:start + batchSize]
+      with stage.step('decode'):
+        images = np.stack([np.asarray(Image.open(artPath + art).convert('L'), dtype=np.uint8)
+                            for art in batchFiles])
+      with stage.step('hash'):
+        hashes[start:start + len(images)] = perceptualHashes(images)
+        flippedHashes[start:start + len(images)] = perceptualHashes(images, flipped=True)
+      stage.tick(len(images))
+  return hashes, flippedHashes
+
+def artClusters(artPath, maxDistance=4, numBands=None, matchFlips=True, batchSize=1024,
+                  maxBucketSize=256):
+  '''
+  Clusters the near-duplicate card art of a directory: reprints, alternate scans and the flipped
+    and blurred copies made by generateData. The result is stored in the directory and reused
+    until a file is added, removed or rewritten, or the parameters change
+  Inputs:
+    artPath: path to card art directory
+    maxDistance: largest number of differing hash bits for two images to be duplicates (4)
+    numBands: number of bands of the hash index, see findDuplicates (None)
+    matchFlips: boolean for whether mirrored images count as duplicates (True)
+    batchSize: number of images hashed per vectorized batch (1024)
+    maxBucketSize: see findDuplicates (256)
+  Outputs:
+    fileToCluster: dictionary from art file name to cluster number
+  '''
+  files = sorted(art for art in listdir(artPath) if not art.startswith('.'))
+  fileStamps = '\n'.join('%s\t%d\t%r' % (art, getsize(artPath + art), getmtime(artPath + art))
+                          for art in files)
+  params = {'maxDistance': maxDistance, 'numBands': numBands, 'matchFlips': matchFlips,
+            'maxBucketSize': maxBucketSize,
+            'files': hashlib.sha1(fileStamps.encode('utf-8')).hexdigest()}
+  clustersPath = artPath + CLUSTERS_FILE
+  if exists(clustersPath):
+    with io.open(clustersPath, encoding='utf-8') as clustersFile:
+      stored = json.load(clustersFile)
+    if stored['params'] == params:
+      return dict(zip(files, stored['clusters']))
+
+  hashes, flippedHashes = hashArtDirectory(artPath, files, batchSize)
+  clusters, pairs = findDuplicates(hashes, maxDistance, numBands,
+                                    flippedHashes if matchFlips else None, maxBucketSize)
+  logger.info('artClusters: %d files in %d clusters, %d duplicate pairs', len(files),
+                len(np.unique(clusters)), len(pairs))
+  with io.open(clustersPath + '.tmp', 'w', encoding='utf-8') as clustersFile:
+    json.dump({'params': params, 'clusters': clusters.tolist()}, clustersFile)
+  replace(clustersPath + '.tmp', clustersPath)
+  return dict(zip(files, clusters.tolist()))
+
+def selectDuplicates(files, fileToCluster, duplicates, testProp, random):
+  '''
+  Applies a duplicate handling mode to a list of art files before the train/test split
+  Inputs:
+    files: art file names
+    fileToCluster: dictionary from art file name to cluster number, from artClusters
+    duplicates: None to keep every file, 'keepOne' to keep one file per cluster (the shortest
+      name, usually the unmodified art) or 'splitByCluster' to put whole clusters on one side of
+      the split
+    testProp: proportion of art to separate from training for test/validation
+    random: function returning a random float in [0, 1), e.g. random.random
+  Outputs:
+    files: the art files to use
+    isTest: boolean for every kept file of whether it goes to the test/validation set
+  '''
+  if duplicates not in DUPLICATE_MODES:
+    raise ValueError('duplicates must be one of %s, got %r' % (DUPLICATE_MODES, duplicates))
+  if duplicates == 'keepOne':
+    kept = {}
+    for art in files:
+      cluster = fileToCluster[art]
+      if cluster not in kept or (len(art), art) < (len(kept[cluster]), kept[cluster]):
+        kept[cluster] = art
+    keptFiles = set(kept.values())
+    files = [art for art in files if art in keptFiles]
+  if duplicates == 'splitByCluster':
+    clusterIsTest = {}
+    isTest = []
+    for art in files:
+      cluster = fileToCluster[art]
+      if cluster not in clusterIsTest:
+        clusterIsTest[cluster] = random() < testProp
+      isTest.append(clusterIsTest[cluster])
+    return files, isTest
+  return files, [random() < testProp for _ in files]
@@ -0,0 +1,215 @@
+from os import listdir, makedirs, replace
+from os.path import exists
+from PIL import Image
+import io
+import json
+import numpy as np
+
+from scanManifest import parseCardFileName
+from instrumentation import Stage
+
+SHARD_FILE = 'records-%05d.bin'
+INDEX_FILE = 'index.npz'
+NAMES_FILE = 'names.json'
+META_FILE = 'meta.json'
+
+def writeArtRecords(artPath, jsonPath, recordsPath, cutoffSize=500, shardSize=1 << 26, seed=0):
+  '''
+  Packs every card art file into a few large shard files with an offset index, so loaders read
+    large sequential blocks instead of opening one small file per image. Records keep the encoded
+    bytes of the art files and are written in a seeded random order, so every shard is a random
+    sample of the art
+  Inputs:
+    artPath: path to card art directory
+    jsonPath: path to card info json file
+    recordsPath: directory to store the shards and index in
+    cutoffSize: minimum representation for a primary type to be valid (500)
+    shardSize: number of bytes after which a new shard is started (1 << 26)
+    seed: seed for the record order (0)
+  Outputs:
+    numRecords: number of records stored
+  '''
+  from utils import generateCardToSimpleTypeDict
+
+  cardNameToCategories, numCategories, typeToCategory = generateCardToSimpleTypeDict(jsonPath,
+                                                                                      cutoffSize)
+  artFiles = [art for art in sorted(listdir(artPath)) if not art.startswith('.')]
+  if not artFiles:
+    raise ValueError('No card art found in ' + artPath)
+  if not exists(recordsPath):
+    makedirs(recordsPath)
+  artFiles = [artFiles[index] for index in np.random.RandomState(seed).permutation(len(artFiles))]
+
+  shards = np.empty(len(artFiles), dtype=np.int32)
+  offsets = np.empty(len(artFiles), dtype=np.int64)
+  lengths = np.empty(len(artFiles), dtype=np.int64)
+  labels = np.empty(len(artFiles), dtype=np.int32)
+  names = []
+  shard, offset = 0, 0
+  shardFile = open(recordsPath + '/' + SHARD_FILE % shard, 'wb')
+  with Stage('writeArtRecords', total=len(artFiles)) as stage:
+    try:
+      for index, art in enumerate(artFiles):
+        if offset >= shardSize:
+          shardFile.close()
+          shard, offset = shard + 1, 0
+          shardFile = open(recordsPath + '/' + SHARD_FILE % shard, 'wb')
+        with stage.step('read'):
+          with open(artPath + art, 'rb') as artFile:
+            data = artFile.read()
+        shardFile.write(data)
+        cardName = parseCardFileName(art)
+        shards[index], offsets[index], lengths[index] = shard, offset, len(data)
+        labels[index] = cardNameToCategories.get(cardName, typeToCategory['Other'])
+        names.append(cardName)
+        offset += len(data)
+        stage.tick()
+    finally:
+      shardFile.close()
+
+  np.savez(recordsPath + '/' + INDEX_FILE, shards=shards, offsets=offsets, lengths=lengths,
+            labels=labels)
+  with io.open(recordsPath + '/' + NAMES_FILE, 'w', encoding='utf-8') as namesFile:
+    json.dump({'names': names, 'files': artFiles}, namesFile)
+  # Written last, its presence marks a complete record set
+  shape = np.array(Image.open(artPath + artFiles[0])).shape
+  with io.open(recordsPath + '/' + META_FILE + '.tmp', 'w', encoding='utf-8') as metaFile:
+    json.dump({'numCategories': numCategories, 'typeToCategory': typeToCategory,
+                'cutoffSize': cutoffSize, 'seed': seed, 'shape': list(shape),
+                'numShards': shard + 1}, metaFile)
+  replace(recordsPath + '/' + META_FILE + '.tmp', recordsPath + '/' + META_FILE)
+  return len(artFiles)
+
+def artRecordsExist(recordsPath):
+  '''
+  Returns True if a complete record set is stored at recordsPath, False otherwise
+  Inputs:
+    recordsPath: directory the records are stored in
+  '''
+  return exists(recordsPath + '/' + META_FILE)
+
+def decodeRecord(data):
+  '''
+  Decodes the encoded bytes of one record into a uint8 image array
+  '''
+  return np.asarray(Image.open(io.BytesIO(data)), dtype=np.uint8)
+
+class ArtRecords(object):
+  '''
+  Reader for a record set written by writeArtRecords. Only the index is loaded on creation, shards
+    are read whole and in order by iterShards, or a record at a time by fetch
+  '''
+  def __init__(self, recordsPath):
+    '''
+    Inputs:
+      recordsPath: directory the records are stored in
+    '''
+    self.recordsPath = recordsPath
+    with io.open(recordsPath + '/' + META_FILE, encoding='utf-8') as metaFile:
+      self.meta = json.load(metaFile)
+    index = np.load(recordsPath + '/' + INDEX_FILE)
+    self.shards = index['shards']
+    self.offsets = index['offsets']
+    self.lengths = index['lengths']
+    self.labels = index['labels']
+    with io.open(recordsPath + '/' + NAMES_FILE, encoding='utf-8') as namesFile:
+      namesData = json.load(namesFile)
+    self.names = namesData['names']
+    self.files = namesData['files']
+    self.nameToRecords = {}
+    for record, cardName in enumerate(self.names):
+      self.nameToRecords.setdefault(cardName, []).append(record)
+    self.fileToRecord = dict((art, record) for record, art in enumerate(self.files))
+
+  def __len__(self):
+    return len(self.names)
+
+  def readShard(self, shard):
+    '''
+    Reads one shard with a single sequential read
+    Inputs:
+      shard: number of the shard
+    Outputs:
+      records: array of the record numbers in the shard, in file order
+      data: bytes of the whole shard
+    '''
+    with open(self.recordsPath + '/' + SHARD_FILE % shard, 'rb') as shardFile:
+      data = shardFile.read()
+    return np.flatnonzero(self.shards == shard), data
+
+  def iterShards(self, shuffle=False, seed=None):
+    '''
+    Yields the decoded records of one shard at a time
+    Inputs:
+      shuffle: boolean for whether to visit shards in random order (False)
+      seed: seed for the shard order (None)
+    Outputs:
+      generator of (records, images, labels) tuples, records are record numbers and images a uint8
+        array of shape (numRecords, height, width, channels)
+    '''
+    order = np.arange(self.meta['numShards'])
+    if shuffle:
+      np.random.RandomState(seed).shuffle(order)
+    for shard in order:
+      records, data = self.readShard(shard)
+      view = memoryview(data)
+      images = np.stack([decodeRecord(view[self.offsets[record]:
+                                            self.offsets[record] + self.lengths[record]])
+                          for record in records])
+      yield records, images, self.labels[records]
+
+  def readRecord(self, record):
+    '''
+    Reads and decodes a single record with one seek and read
+    Inputs:
+      record: record number
+    Outputs:
+      image: uint8 image array
+    '''
+    with open(self.recordsPath + '/' + SHARD_FILE % self.shards[record], 'rb') as shardFile:
+      shardFile.seek(self.offsets[record])
+      return decodeRecord(shardFile.read(self.lengths[record]))
+
+  def fetch(self, cardName):
+    '''
+    Reads every record of a card, e.g. its art and any flipped or blurred copies
+    Inputs:
+      cardName: name of the card
+    Outputs:
+      records: list of (file name, label, image) tuples, empty if the card has no records
+    '''
+    return [(self.files[record], int(self.labels[record]), self.readRecord(record))
+              for record in self.nameToRecords.get(cardName, [])]
+
+  def fetchFile(self, fileName):
+    '''
+    Reads the record of a single art file by its file name, raising KeyError if it is not stored
+    '''
+    return self.readRecord(self.fileToRecord[fileName])
+
+def loadArtRecords(recordsPath, testProp=0.2, seed=None):
+  '''
+  Reads a record set shard by shard into training and test/validation sets
+  Inputs:
+    recordsPath: directory the records are stored in
+    testProp: proportion of art to separate from training for test/validation (0.2)
+    seed: seed for the split (None)
+  Outputs:
+    X: training art arrays
+    Y: training category targets
+    X_Test: testing art arrays
+    Y_Test: testing category targets
+    numCategories: total number of valid categories
+  '''
+  artRecords = ArtRecords(recordsPath)
+  random = np.random.RandomState(seed)
+  X, Y, X_Test, Y_Test = [], [], [], []
+  with Stage('loadArtRecords', total=len(artRecords)) as stage:
+    for _, images, labels in artRecords.iterShards():
+      isTest = random.random_sample(len(images)) < testProp
+      X.extend(images[~isTest].astype(np.float64))
+      Y.extend(labels[~isTest].tolist())
+      X_Test.extend(images[isTest].astype(np.float64))
+      Y_Test.extend(labels[isTest].tolist())
+      stage.tick(len(images))
+  return (X, Y), (X_Test, Y_Test), artRecords.meta['numCategories']
@@ -0,0 +1,258 @@
+from __future__ import division, absolute_import
+
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from PIL import Image
+from queue import Queue, Empty
+import argparse
+import json
+import os
+import threading
+import time
+import numpy as np
+
+from instrumentation import logger, configureInstrumentation
+
+class MicroBatcher(object):
+  '''
+  Gathers single-sample prediction requests from many threads into batches. A batch is run as soon
+    as it holds maxBatchSize samples or its oldest sample has waited maxLatency seconds
+  '''
+  def __init__(self, predict, maxBatchSize=64, maxLatency=0.01, historySize=10000):
+    '''
+    Inputs:
+      predict: function from a float32 batch of samples to an array of predictions
+      maxBatchSize: largest number of samples per predict call (64)
+      maxLatency: longest time in seconds a sample waits for its batch to fill (0.01)
+      historySize: number of recent requests kept for latency metrics (10000)
+    '''
+    self.predict = predict
+    self.maxBatchSize = maxBatchSize
+    self.maxLatency = maxLatency
+    self.requests = Queue()
+    self.latencies = deque(maxlen=historySize)
+    self.batchSizes = deque(maxlen=historySize)
+    self.numServed = 0
+    self.lock = threading.Lock()
+    self.thread = threading.Thread(target=self._run)
+    self.thread.daemon = True
+    self.thread.start()
+
+  def submit(self, samples):
+    '''
+    Queues samples and waits for their predictions, samples of one call may share a batch with
+      other callers' samples
+    Inputs:
+      samples: list of input arrays of single samples
+    Outputs:
+      predictions: list of the model's output for every sample
+    '''
+    requests = [{'sample': sample, 'time': time.time(), 'done': threading.Event()}
+                  for sample in samples]
+    for request in requests:
+      self.requests.put(request)
+    for request in requests:
+      request['done'].wait()
+      if 'error' in request:
+        raise request['error']
+    return [request['prediction'] for request in requests]
+
+  def _run(self):
+    while True:
+      batch = [self.requests.get()]
+      deadline = batch[0]['time'] + self.maxLatency
+      while len(batch) < self.maxBatchSize:
+        remaining = deadline - time.time()
+        try:
+          batch.append(self.requests.get(timeout=remaining) if remaining > 0
+                        else self.requests.get_nowait())
+        except Empty:
+          break
+      self._predictBatch(batch)
+      finished = time.time()
+      with self.lock:
+        self.batchSizes.append(len(batch))
+        self.numServed += len(batch)
+        for request in batch:
+          self.latencies.append(finished - request['time'])
+      for request in batch:
+        request['done'].set()
+
+  def _predictBatch(self, batch):
+    '''
+    Predicts a batch of requests. If the batch fails, its requests are retried in groups of one
+      sample shape and then one at a time, so an error only reaches the requests that cause it
+    '''
+    try:
+      predictions = self.predict(np.stack([request['sample'] for request in batch]))
+      for request, prediction in zip(batch, predictions):
+        request['prediction'] = prediction
+      return
+    except Exception as error:
+      if len(batch) == 1:
+        batch[0]['error'] = error
+        return
+    groups = {}
+    for request in batch:
+      sample = request['sample']
+      groups.setdefault((sample.shape, sample.dtype.str), []).append(request)
+    if len(groups) > 1:
+      for group in groups.values():
+        self._predictBatch(group)
+    else:
+      for request in batch:
+        self._predictBatch([request])
+
+  def metrics(self):
+    '''
+    Returns latency percentiles in milliseconds, mean batch size, requests served and current
+      queue depth
+    '''
+    with self.lock:
+      latencies = list(self.latencies)
+      batchSizes = list(self.batchSizes)
+      numServed = self.numServed
+    metrics = {'queueDepth': self.requests.qsize(), 'served': numServed,
+                'meanBatchSize': float(np.mean(batchSizes)) if batchSizes else None}
+    if latencies:
+      p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1000
+      metrics.update({'latencyP50Ms': float(p50), 'latencyP90Ms': float(p90),
+                      'latencyP99Ms': float(p99)})
+    return metrics
+
+def resolveArtFile(artPath, art):
+  '''
+  Returns the path of an art file named in a request, raising ValueError for names that are not a
+    plain file name directly inside artPath
+  '''
+  root = os.path.realpath(artPath)
+  if (not isinstance(art, str) or not art or '/' in art or os.sep in art or '..' in art or
+      os.path.dirname(os.path.realpath(os.path.join(root, art))) != root):
+    raise ValueError('invalid art file name: %r' % (art,))
+  return os.path.join(root, art)
+
+def loadSample(artPath, art, inputShape):
+  '''
+  Decodes one requested art file into a float32 sample, raising ValueError if its shape does not
+    match the model input, e.g. grayscale or RGBA art, or art of another resolution
+  '''
+  sample = np.asarray(Image.open(resolveArtFile(artPath, art)), dtype=np.float32)
+  if inputShape is not None and sample.shape != tuple(inputShape):
+    raise ValueError('%s has shape %s, the model expects %s' % (art, sample.shape,
+                                                                  tuple(inputShape)))
+  return sample
+
+def makeHandler(batcher, artPath, categoryToType, inputShape=None):
+  '''
+  Creates the request handler class for an art classifier service
+  Inputs:
+    batcher: MicroBatcher over the loaded model
+    artPath: path to card art, request file names are relative to it
+    categoryToType: map from category number to type name
+    inputShape: shape of one model input sample, requested art of another shape is rejected
+      before it reaches a batch (None)
+  '''
+  typeNames = [categoryToType[category] for category in range(len(categoryToType))]
+
+  class ArtClassifierHandler(BaseHTTPRequestHandler):
+    def _respond(self, status, body):
+      data = json.dumps(body).encode('utf-8')
+      self.send_response(status)
+      self.send_header('Content-Type', 'application/json')
+      self.send_header('Content-Length', str(len(data)))
+      self.end_headers()
+      self.wfile.write(data)
+
+    def do_GET(self):
+      if self.path == '/metrics':
+        self._respond(200, batcher.metrics())
+      else:
+        self._respond(404, {'error': 'unknown path'})
+
+    def do_POST(self):
+      '''
+      POST /predict with {"files": [art file names]} returns the predicted primary type and
+        per-type probabilities of every file
+      '''
+      if self.path != '/predict':
+        self._respond(404, {'error': 'unknown path'})
+        return
+      try:
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        files = request['files']
+        if not isinstance(files, list):
+          raise ValueError('files must be a list of art file names')
+        samples = [loadSample(artPath, art, inputShape) for art in files]
+      except (KeyError, TypeError, ValueError, IOError) as error:
+        self._respond(400, {'error': str(error)})
+        return
+      try:
+        predictions = batcher.submit(samples)
+      except Exception as error:
+        logger.exception('Prediction failed')
+        self._respond(500, {'error': '%s: %s' % (type(error).__name__, error)})
+        return
+      results = [{'file': art, 'prediction': typeNames[int(np.argmax(prediction))],
+                  'probabilities': dict(zip(typeNames, map(float, prediction)))}
+                  for art, prediction in zip(files, predictions)]
+      self._respond(200, {'results': results})
+
+    def log_message(self, format, *args):
+      logger.debug(format, *args)
+
+  return ArtClassifierHandler
+
+def serveArtClassifier(artPath, jsonPath, modelPath, host='127.0.0.1', port=8765, cutoffSize=500,
+                        maxBatchSize=64, maxLatency=0.01, datasetPath=None):
+  '''
+  Loads the primary type classifier and its category map once and serves predictions over local
+    HTTP until interrupted. Concurrent requests are gathered into micro-batches
+  Inputs:
+    artPath: path to card art
+    jsonPath: path to card data json file
+    modelPath: path to trained model
+    host: address to listen on ('127.0.0.1')
+    port: port to listen on (8765)
+    cutoffSize: minimum representation for a primary type to be valid, must match training (500)
+    maxBatchSize: largest number of samples per predict call (64)
+    maxLatency: longest time in seconds a sample waits for its batch to fill (0.01)
+    datasetPath: directory of the art cache the model was trained with, for its normalization
+      statistics if none are stored with the model's checkpoint (None)
+  '''
+  from utils import generateCardToSimpleTypeDict
+  from models import artToPrimaryTypeModel, ART_INPUT_SHAPE
+
+  _, numCategories, typeToCategory = generateCardToSimpleTypeDict(jsonPath, cutoffSize)
+  categoryToType = dict((v,k) for k,v in typeToCategory.items())
+  model = artToPrimaryTypeModel(numCategories, datasetPath=datasetPath, modelPath=modelPath)
+  model.load(modelPath, weights_only=True)
+
+  batcher = MicroBatcher(lambda batch: np.asarray(model.predict(batch)), maxBatchSize,
+                          maxLatency)
+  server = ThreadingHTTPServer((host, port), makeHandler(batcher, artPath, categoryToType,
+                                                                ART_INPUT_SHAPE))
+  logger.info('Serving art classifier on http://%s:%d', host, port)
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Serve the art classifier over local HTTP')
+  parser.add_argument('artPath', help='path to card art, ending in /')
+  parser.add_argument('jsonPath', help='path to card data json file')
+  parser.add_argument('modelPath', help='path to trained classifier model')
+  parser.add_argument('--host', default='127.0.0.1')
+  parser.add_argument('--port', type=int, default=8765)
+  parser.add_argument('--cutoffSize', type=int, default=500)
+  parser.add_argument('--maxBatchSize', type=int, default=64)
+  parser.add_argument('--maxLatency', type=float, default=0.01)
+  parser.add_argument('--datasetPath', default=None)
+  args = parser.parse_args()
+  configureInstrumentation()
+  serveArtClassifier(args.artPath, args.jsonPath, args.modelPath, host=args.host,
+                      port=args.port, cutoffSize=args.cutoffSize,
+                      maxBatchSize=args.maxBatchSize, maxLatency=args.maxLatency,
+                      datasetPath=args.datasetPath)
@@ -0,0 +1,82 @@
+import numpy as np
+
+def gaussianKernel(sigma):
+  '''
+  Creates a normalized 1d gaussian kernel reaching out 3 standard deviations
+  Inputs:
+    sigma: standard deviation of the gaussian in pixels
+  Outputs:
+    kernel: float32 array of odd length
+  '''
+  radius = max(int(np.ceil(3 * sigma)), 1)
+  offsets = np.arange(-radius, radius + 1, dtype=np.float32)
+  kernel = np.exp(-0.5 * (offsets / sigma) ** 2)
+  return kernel / kernel.sum()
+
+def gaussianBlur(batch, sigma):
+  '''
+  Blurs a whole batch of images with a separable gaussian, edges are reflected
+  Inputs:
+    batch: float array of shape (numImages, height, width[, channels])
+    sigma: standard deviation of the gaussian in pixels
+  Outputs:
+    blurred: float32 array of the same shape
+  '''
+  kernel = gaussianKernel(sigma)
+  radius = len(kernel) // 2
+  blurred = np.asarray(batch, dtype=np.float32)
+  for axis in (1, 2):
+    padWidth = [(0, 0)] * blurred.ndim
+    padWidth[axis] = (radius, radius)
+    padded = np.pad(blurred, padWidth, mode='reflect')
+    length = blurred.shape[axis]
+    result = np.zeros_like(blurred)
+    for offset, weight in enumerate(kernel):
+      result += weight * np.take(padded, np.arange(offset, offset + length), axis=axis)
+    blurred = result
+  return blurred
+
+class BatchAugmentor(object):
+  '''
+  Applies random flips and blurs to whole batches of images at load time, replacing the flip_,
+    blur_ and blur_flip_ copies generateData used to write to disk. Each image is independently
+    flipped with probability flipProb and blurred with probability blurProb, using a seeded random
+    state so runs are reproducible
+  '''
+  def __init__(self, flipProb=0.5, blurProb=0.5, blurSigmas=(0.6, 0.8), seed=0):
+    '''
+    Inputs:
+      flipProb: probability of flipping an image left to right (0.5)
+      blurProb: probability of blurring an image (0.5)
+      blurSigmas: gaussian standard deviations to pick from when blurring, matching the radii
+        generateData used for blur_ and blur_flip_ ((0.6, 0.8))
+      seed: seed for the random state (0)
+    '''
+    self.flipProb = flipProb
+    self.blurProb = blurProb
+    self.blurSigmas = blurSigmas
+    self.random = np.random.RandomState(seed)
+
+  def __call__(self, batch, random=None):
+    '''
+    Augments a batch of images
+    Inputs:
+      batch: array of shape (numImages, height, width[, channels])
+      random: RandomState to draw from instead of the augmentor's own, so batches augmented on
+        several threads get the same draws whatever order they run in (None)
+    Outputs:
+      augmented: float32 array of the same shape
+    '''
+    if random is None:
+      random = self.random
+    augmented = np.array(batch, dtype=np.float32)
+    flipped = random.random_sample(len(augmented)) < self.flipProb
+    augmented[flipped] = augmented[flipped][:, :, ::-1]
+
+    blurred = random.random_sample(len(augmented)) < self.blurProb
+    sigmaChoice = random.randint(len(self.blurSigmas), size=len(augmented))
+    for sigmaIndex, sigma in enumerate(self.blurSigmas):
+      selected = blurred & (sigmaChoice == sigmaIndex)
+      if selected.any():
+        augmented[selected] = gaussianBlur(augmented[selected], sigma)
+    return augmented
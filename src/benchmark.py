@@ -0,0 +1,231 @@
+from __future__ import division, absolute_import
+
+from os import makedirs, remove
+from os.path import exists
+from PIL import Image
+import argparse
+import io
+import json
+import platform
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+SYNTHETIC_TYPES = ['Creature', 'Instant', 'Sorcery', 'Enchantment', 'Artifact', 'Land',
+                    'Planeswalker', 'Tribal']
+SYNTHETIC_SUBTYPES = ['Elf', 'Goblin', 'Human', 'Wizard', 'Aura', 'Equipment', 'Forest', 'Island',
+                        'Zombie', 'Dragon']
+SYNTHETIC_WORDS = ['Ancient', 'Blazing', 'Crypt', 'Dread', 'Ember', 'Feral', 'Grave', 'Hollow',
+                    'Iron', 'Jade', 'Keeper', 'Lord', 'Mire', 'Night', 'Oath', 'Pyre']
+
+def generateSyntheticCards(jsonPath, numCards, seed=0):
+  '''
+  Writes a synthetic card data json file with the same structure as AllCards.json
+  Inputs:
+    jsonPath: path to write the json file to
+    numCards: number of cards to generate
+    seed: seed for the random card contents (0)
+  Outputs:
+    cardNames: list of the generated card names
+  '''
+  rand = random.Random(seed)
+  cardData = {}
+  for index in range(numCards):
+    cardName = '%s %s %d' % (rand.choice(SYNTHETIC_WORDS), rand.choice(SYNTHETIC_WORDS), index)
+    card = {'layout': 'token' if rand.random() < 0.02 else 'normal',
+            'types': rand.sample(SYNTHETIC_TYPES, 1 if rand.random() < 0.9 else 2),
+            'text': ' '.join(rand.choice(SYNTHETIC_WORDS) for _ in range(rand.randint(0, 40)))}
+    if rand.random() < 0.6:
+      card['subtypes'] = rand.sample(SYNTHETIC_SUBTYPES, rand.randint(1, 2))
+    cardData[cardName] = card
+  with io.open(jsonPath, 'w', encoding='utf-8') as jsonFile:
+    json.dump(cardData, jsonFile)
+  return list(cardData)
+
+def generateSyntheticScans(cardsPath, cardNames, width=312, height=445, seed=0):
+  '''
+  Writes one synthetic jpeg card scan per card name, made of random color blocks so the codec
+    does real work
+  Inputs:
+    cardsPath: directory to write the scans to, ending in '/'
+    cardNames: names of the cards to generate scans for
+    width: scan width in pixels (312)
+    height: scan height in pixels (445)
+    seed: seed for the scan contents (0)
+  '''
+  rand = np.random.RandomState(seed)
+  for index, cardName in enumerate(cardNames):
+    blocks = rand.randint(0, 256, size=(height // 16 + 1, width // 16 + 1, 3)).astype(np.uint8)
+    pixels = np.repeat(np.repeat(blocks, 16, axis=0), 16, axis=1)[:height, :width]
+    Image.fromarray(pixels).save(cardsPath + '%d.%s.jpg' % (index, cardName), quality=85)
+
+def timeStage(name, function, numItems, results, setup=None):
+  '''
+  Runs one pipeline stage twice, a timed pass and then a pass under tracemalloc for its peak
+    memory, so the tracing overhead is not part of the recorded time
+  Inputs:
+    name: stage name
+    function: function taking no arguments that runs the stage
+    numItems: number of items the stage processes, for throughput
+    results: dictionary the stage's measurements are added to under name
+    setup: function taking no arguments run before each pass, e.g. to clear a cache (None)
+  Outputs:
+    result: the function's return value from the timed pass
+  '''
+  if setup is not None:
+    setup()
+  startTime = time.time()
+  result = function()
+  seconds = time.time() - startTime
+
+  if setup is not None:
+    setup()
+  tracemalloc.start()
+  try:
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+  finally:
+    tracemalloc.stop()
+  results[name] = {'seconds': seconds, 'peakMemoryBytes': peak, 'items': numItems,
+                    'itemsPerSecond': numItems / seconds if seconds > 0 else None}
+  print('%-32s %9.3fs %10.1f items/sec %8.1f MB peak' %
+          (name, seconds, numItems / max(seconds, 1e-9), peak / 2 ** 20))
+  return result
+
+def runBenchmarks(numCards, workPath=None, numScans=None, seed=0):
+  '''
+  Generates a synthetic data set and times each stage of the preprocessing, loading and demo
+    pipelines on it
+  Inputs:
+    numCards: number of synthetic cards
+    workPath: directory for the synthetic data, a temporary directory if None (None)
+    numScans: number of synthetic scans, if None will be set to numCards (None)
+    seed: seed for the synthetic data (0)
+  Outputs:
+    results: dictionary from stage name to its measurements
+  '''
+  from utils import generatePics, generateCardToSimpleTypeDict, turnPicsToSimpleInputs, \
+    simpleGenerateTypeSubtypeToNameInputs
+  import cardTable
+  import scanManifest
+
+  if numScans is None:
+    numScans = numCards
+  ownsWorkPath = workPath is None
+  if ownsWorkPath:
+    workPath = tempfile.mkdtemp(prefix='mtgBenchmark')
+  cardsPath = workPath + '/cards/'
+  artPath = workPath + '/art/'
+  jsonPath = workPath + '/AllCards.json'
+  for path in (cardsPath, artPath):
+    if exists(path):
+      shutil.rmtree(path)
+    makedirs(path)
+
+  results = {}
+  try:
+    cardNames = timeStage('generateSyntheticCards',
+                          lambda: generateSyntheticCards(jsonPath, numCards, seed), numCards,
+                          results)
+    timeStage('generateSyntheticScans',
+              lambda: generateSyntheticScans(cardsPath, cardNames[:numScans], seed=seed),
+              numScans, results)
+
+    def removeTableCache():
+      # Both the stored table and the copy kept in memory by loadCardTable
+      cardTable._loadedTables.clear()
+      if exists(jsonPath + '.table.npz'):
+        remove(jsonPath + '.table.npz')
+
+    def removeScanManifest():
+      if exists(artPath + scanManifest.MANIFEST_FILE):
+        remove(artPath + scanManifest.MANIFEST_FILE)
+
+    timeStage('generateCardToSimpleTypeDict.cold',
+              lambda: generateCardToSimpleTypeDict(jsonPath), numCards, results,
+              setup=removeTableCache)
+    timeStage('generateCardToSimpleTypeDict.warm',
+              lambda: generateCardToSimpleTypeDict(jsonPath), numCards, results)
+    try:
+      timeStage('simpleGenerateTypeSubtypeToNameInputs',
+                lambda: simpleGenerateTypeSubtypeToNameInputs(jsonPath, 70), numCards, results)
+    except ImportError as error:
+      print('Skipping name inputs stage: %s' % error)
+    timeStage('generatePics', lambda: generatePics(cardsPath), numScans, results)
+    (X, Y), (X_Test, Y_Test), numCategories = timeStage(
+      'turnPicsToSimpleInputs', lambda: turnPicsToSimpleInputs(artPath, jsonPath), numScans,
+      results, setup=removeScanManifest)
+
+    try:
+      from models import artToPrimaryTypeModel
+      from evaluation import predictInBatches
+      # tflearn is only imported once a model is built
+      model = artToPrimaryTypeModel(numCategories)
+    except ImportError as error:
+      print('Skipping demo inference stage: %s' % error)
+    else:
+      inputs = X + X_Test
+      timeStage('demoInference',
+                lambda: np.argmax(predictInBatches(model, inputs), axis=1), len(inputs), results)
+  finally:
+    if ownsWorkPath:
+      shutil.rmtree(workPath)
+  return results
+
+def currentCommit():
+  '''
+  Returns the current git commit hash, or None outside of a git checkout
+  '''
+  try:
+    return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                    stderr=subprocess.STDOUT).decode().strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+def compareBenchmarks(basePath, newPath):
+  '''
+  Prints the per-stage change in time and peak memory between two benchmark result files
+  Inputs:
+    basePath: path to the baseline results file
+    newPath: path to the new results file
+  '''
+  with io.open(basePath, encoding='utf-8') as baseFile:
+    base = json.load(baseFile)
+  with io.open(newPath, encoding='utf-8') as newFile:
+    new = json.load(newFile)
+  for size in sorted(set(base['runs']) & set(new['runs']), key=int):
+    print('\n%s cards (%s -> %s)' % (size, base['commit'], new['commit']))
+    for stage, newResult in new['runs'][size].items():
+      if stage not in base['runs'][size]:
+        continue
+      baseResult = base['runs'][size][stage]
+      print('%-32s time %+7.1f%%  memory %+7.1f%%' %
+              (stage, (newResult['seconds'] / max(baseResult['seconds'], 1e-9) - 1) * 100,
+                (newResult['peakMemoryBytes'] / max(baseResult['peakMemoryBytes'], 1) - 1) * 100))
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Benchmark the data pipeline on synthetic data')
+  parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='numbers of synthetic cards to benchmark')
+  parser.add_argument('--maxScans', type=int, default=None,
+                        help='cap on the number of synthetic scans per size')
+  parser.add_argument('--output', default='benchmark_results.json')
+  parser.add_argument('--compare', default=None,
+                        help='baseline results file to compare the new results against')
+  parser.add_argument('--seed', type=int, default=0)
+  args = parser.parse_args()
+
+  runs = {}
+  for size in args.sizes:
+    print('\nBenchmarking %d cards' % size)
+    numScans = min(size, args.maxScans) if args.maxScans else size
+    runs[str(size)] = runBenchmarks(size, numScans=numScans, seed=args.seed)
+  with io.open(args.output, 'w', encoding='utf-8') as outputFile:
+    json.dump({'commit': currentCommit(), 'python': platform.python_version(),
+                'numpy': np.__version__, 'seed': args.seed, 'runs': runs}, outputFile, indent=2)
+  if args.compare:
+    compareBenchmarks(args.compare, args.output)
@@ -0,0 +1,106 @@
+from __future__ import division, absolute_import
+
+from os import listdir
+from os.path import exists
+from PIL import Image
+import argparse
+import csv
+import io
+import numpy as np
+
+from utils import generateCardToSimpleTypeDict
+from scanManifest import parseCardFileName
+from models import artToPrimaryTypeModel
+from evaluation import predictInBatches
+from instrumentation import Stage, logger, configureInstrumentation
+
+def readScoredFiles(outputPath):
+  '''
+  Reads the art files already scored in a previous, possibly interrupted, run. A partially written
+    last line is dropped from the file so it is scored again
+  Inputs:
+    outputPath: path to the csv output file
+  Outputs:
+    scoredFiles: set of art file names already in the output
+  '''
+  if not exists(outputPath):
+    return set()
+  with io.open(outputPath, 'r', encoding='utf-8', newline='') as outputFile:
+    contents = outputFile.read()
+  if contents and not contents.endswith('\n'):
+    contents = contents[:contents.rfind('\n') + 1]
+    with io.open(outputPath, 'w', encoding='utf-8', newline='') as outputFile:
+      outputFile.write(contents)
+  rows = list(csv.reader(io.StringIO(contents)))
+  return set(row[0] for row in rows[1:])
+
+def scoreArtDirectory(artPath, jsonPath, modelPath, outputPath, cutoffSize=500, chunkSize=1024,
+                        batchSize=256, resume=True):
+  '''
+  Classifies every card art file in a directory with a trained primary type classifier, writing
+    one csv row per file as each chunk finishes
+  Inputs:
+    artPath: path to card art
+    jsonPath: path to card data json file
+    modelPath: path to trained model
+    outputPath: path to the csv output file
+    cutoffSize: minimum representation for a primary type to be valid, must match training (500)
+    chunkSize: number of art files decoded at a time (1024)
+    batchSize: number of art files per predict call (256)
+    resume: boolean for whether to keep an existing output file and skip the files in it (True)
+  Outputs:
+    numScored: number of art files scored by this run
+  '''
+  _, numCategories, typeToCategory = generateCardToSimpleTypeDict(jsonPath, cutoffSize)
+  categoryToType = dict((v,k) for k,v in typeToCategory.items())
+  typeNames = [categoryToType[category] for category in range(numCategories)]
+
+  model = artToPrimaryTypeModel(numCategories, modelPath=modelPath)
+  model.load(modelPath, weights_only=True)
+
+  scoredFiles = readScoredFiles(outputPath) if resume else set()
+  artFiles = [art for art in sorted(listdir(artPath))
+                if not art.startswith('.') and art not in scoredFiles]
+  logger.info('Scoring %d art files, %d already scored', len(artFiles), len(scoredFiles))
+
+  outputFile = io.open(outputPath, 'a' if scoredFiles else 'w', encoding='utf-8', newline='')
+  writer = csv.writer(outputFile)
+  if not scoredFiles:
+    writer.writerow(['file', 'name', 'prediction'] + typeNames)
+
+  try:
+    with Stage('scoreArtDirectory', total=len(artFiles)) as stage:
+      for start in range(0, len(artFiles), chunkSize):
+        chunk = artFiles[start:start + chunkSize]
+        with stage.step('decodeChunk'):
+          inputs = np.stack([np.asarray(Image.open(artPath + art), dtype=np.float32)
+                              for art in chunk])
+        with stage.step('predictChunk'):
+          predictions = predictInBatches(model, inputs, batchSize=batchSize)
+        predicted = np.argmax(predictions, axis=1)
+        for art, category, probabilities in zip(chunk, predicted, predictions):
+          writer.writerow([art, parseCardFileName(art), categoryToType[category]] +
+                            ['%.6f' % probability for probability in probabilities])
+        outputFile.flush()
+        stage.tick(len(chunk))
+  finally:
+    outputFile.close()
+  return stage.count
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Classify every card art file in a directory')
+  parser.add_argument('artPath', help='path to card art, ending in /')
+  parser.add_argument('jsonPath', help='path to card data json file')
+  parser.add_argument('modelPath', help='path to trained classifier model')
+  parser.add_argument('outputPath', help='path to the csv output file')
+  parser.add_argument('--cutoffSize', type=int, default=500)
+  parser.add_argument('--chunkSize', type=int, default=1024)
+  parser.add_argument('--batchSize', type=int, default=256)
+  parser.add_argument('--restart', action='store_true',
+                        help='overwrite the output file instead of resuming from it')
+  parser.add_argument('--metricsPath', default=None, help='file to append stage metrics to')
+  args = parser.parse_args()
+  configureInstrumentation(metricsPath=args.metricsPath)
+  scoreArtDirectory(args.artPath, args.jsonPath, args.modelPath, args.outputPath,
+                      cutoffSize=args.cutoffSize, chunkSize=args.chunkSize,
+                      batchSize=args.batchSize, resume=not args.restart)
@@ -0,0 +1,95 @@
+import io
+import json
+
+CARD_FIELDS = ('types', 'subtypes', 'layout', 'names', 'text')
+
+_decoder = json.JSONDecoder()
+
+class _JsonStream(object):
+  '''
+  Buffered reader over a json file that decodes one value at a time, keeping only the unread part
+    of the file in memory
+  '''
+  def __init__(self, jsonFile, chunkSize):
+    self.jsonFile = jsonFile
+    self.chunkSize = chunkSize
+    self.buffer = ''
+    self.position = 0
+    self.eof = False
+
+  def _fill(self):
+    chunk = self.jsonFile.read(self.chunkSize)
+    if not chunk:
+      self.eof = True
+      return False
+    self.buffer = self.buffer[self.position:] + chunk
+    self.position = 0
+    return True
+
+  def peek(self):
+    '''
+    Skips whitespace and returns the next character, or '' at the end of the file
+    '''
+    while True:
+      while self.position < len(self.buffer) and self.buffer[self.position] in ' \t\n\r':
+        self.position += 1
+      if self.position < len(self.buffer):
+        return self.buffer[self.position]
+      if not self._fill():
+        return ''
+
+  def expect(self, char):
+    if self.peek() != char:
+      raise ValueError('Expected %r at character %d of json stream' % (char, self.position))
+    self.position += 1
+
+  def decode(self):
+    '''
+    Decodes the next json value, reading more of the file until the value is complete
+    '''
+    self.peek()
+    while True:
+      try:
+        value, end = _decoder.raw_decode(self.buffer, self.position)
+        # A number cut off by the chunk boundary still decodes, so values touching the end of
+        # the buffer are only trusted once the file is exhausted
+        if end < len(self.buffer) or self.eof:
+          self.position = end
+          if self.position > self.chunkSize:
+            self.buffer = self.buffer[self.position:]
+            self.position = 0
+          return value
+      except ValueError:
+        if self.eof:
+          raise
+      self._fill()
+
+def iterCards(jsonPath, fields=CARD_FIELDS, chunkSize=1 << 16):
+  '''
+  Incrementally reads a card data json file, yielding one card at a time so memory use does not
+    depend on the size of the file
+  Inputs:
+    jsonPath: path to card data json file, an object from card name to card record
+    fields: record fields to keep, if None every field is kept (CARD_FIELDS)
+    chunkSize: number of characters to read from the file at a time (65536)
+  Outputs:
+    generator of (cardName, record) tuples, record only holding the requested fields that the
+      card has
+  '''
+  with io.open(jsonPath, encoding='utf-8') as jsonFile:
+    stream = _JsonStream(jsonFile, chunkSize)
+    stream.expect('{')
+    if stream.peek() == '}':
+      return
+    while True:
+      cardName = stream.decode()
+      stream.expect(':')
+      card = stream.decode()
+      if fields is not None:
+        card = dict((field, card[field]) for field in fields if field in card)
+      yield cardName, card
+      if stream.peek() == ',':
+        stream.position += 1
+        continue
+      stream.expect('}')
+      return
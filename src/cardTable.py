@@ -0,0 +1,299 @@
+from os.path import getmtime, getsize, exists
+from os import replace
+import json
+import numpy as np
+
+from cardStream import iterCards
+from labelStore import PackedLabels
+
+CACHE_VERSION = 1
+
+class CardTable(object):
+  '''
+  Columnar view of the card data json file. Every card is an integer id, strings are stored as a
+    utf-8 blob with offsets and list fields (types, subtypes) as flat id arrays with offsets
+  Attributes:
+    typeNames: list of type names, ids are in order of first appearance
+    subtypeNames: list of subtype names, ids are in order of first appearance
+    layoutNames: list of layout names, ids are in order of first appearance
+    layoutIds: layout id of every card, -1 if missing
+    typeIds, typeOffsets: types of card i are typeIds[typeOffsets[i]:typeOffsets[i + 1]]
+    subtypeIds, subtypeOffsets: same for subtypes
+    hasTypes, hasSubtypes, hasText: whether the card had the field at all
+  '''
+  def __init__(self, columns):
+    self.columns = columns
+    vocab = json.loads(str(columns['vocab']))
+    self.typeNames = vocab['types']
+    self.subtypeNames = vocab['subtypes']
+    self.layoutNames = vocab['layouts']
+    self.layoutIds = columns['layoutIds']
+    self.typeIds = columns['typeIds']
+    self.typeOffsets = columns['typeOffsets']
+    self.subtypeIds = columns['subtypeIds']
+    self.subtypeOffsets = columns['subtypeOffsets']
+    self.hasTypes = columns['hasTypes']
+    self.hasSubtypes = columns['hasSubtypes']
+    self.hasText = columns['hasText']
+    self._names = None
+    self._nameToId = None
+
+  def __len__(self):
+    return len(self.layoutIds)
+
+  def _string(self, column, cardId):
+    offsets = self.columns[column + 'Offsets']
+    return self.columns[column + 'Blob'][offsets[cardId]:offsets[cardId + 1]].tobytes() \
+      .decode('utf-8')
+
+  def names(self):
+    '''
+    Returns the list of all card names, indexed by card id
+    '''
+    if self._names is None:
+      self._names = [self._string('name', cardId) for cardId in range(len(self))]
+    return self._names
+
+  def nameToId(self):
+    '''
+    Returns a dictionary from card name to card id
+    '''
+    if self._nameToId is None:
+      self._nameToId = dict((name, cardId) for cardId, name in enumerate(self.names()))
+    return self._nameToId
+
+  def name(self, cardId):
+    return self.names()[cardId]
+
+  def text(self, cardId):
+    return self._string('text', cardId)
+
+  def linkedNames(self, cardId):
+    '''
+    Returns the names of all parts of a multi-part card joined with ' - ', or '' if not multi-part
+    '''
+    return self._string('linkedNames', cardId)
+
+  def layout(self, cardId):
+    layoutId = self.layoutIds[cardId]
+    return self.layoutNames[layoutId] if layoutId >= 0 else None
+
+  def types(self, cardId):
+    return [self.typeNames[typeId]
+              for typeId in self.typeIds[self.typeOffsets[cardId]:self.typeOffsets[cardId + 1]]]
+
+  def subtypes(self, cardId):
+    return [self.subtypeNames[subtypeId] for subtypeId in
+              self.subtypeIds[self.subtypeOffsets[cardId]:self.subtypeOffsets[cardId + 1]]]
+
+  def primaryTypeIds(self):
+    '''
+    Returns the id of the first type of every card, -1 for cards with no types
+    '''
+    primary = np.full(len(self), -1, dtype=np.int32)
+    nonEmpty = self.typeOffsets[1:] > self.typeOffsets[:-1]
+    primary[nonEmpty] = self.typeIds[self.typeOffsets[:-1][nonEmpty]]
+    return primary
+
+  def typeCardIds(self):
+    '''
+    Returns the card id of every entry in typeIds
+    '''
+    return np.repeat(np.arange(len(self)), np.diff(self.typeOffsets))
+
+  def records(self):
+    '''
+    Iterates over the cards as (name, record) pairs, with record a dictionary holding the same
+      types, subtypes, layout, names and text fields as the json file
+    '''
+    for cardId, name in enumerate(self.names()):
+      record = {}
+      if self.hasTypes[cardId]:
+        record['types'] = self.types(cardId)
+      if self.hasSubtypes[cardId]:
+        record['subtypes'] = self.subtypes(cardId)
+      if self.layoutIds[cardId] >= 0:
+        record['layout'] = self.layout(cardId)
+      if self.hasText[cardId]:
+        record['text'] = self.text(cardId)
+      linkedNames = self.linkedNames(cardId)
+      if linkedNames:
+        record['names'] = linkedNames.split(' - ')
+      yield name, record
+
+def _vocabId(vocab, value):
+  if value not in vocab:
+    vocab[value] = len(vocab)
+  return vocab[value]
+
+def buildCardColumns(cards):
+  '''
+  Encodes (name, record) pairs into the columns of a CardTable
+  Inputs:
+    cards: iterable of (name, record) pairs
+  Outputs:
+    columns: dictionary of numpy arrays
+  '''
+  typeVocab, subtypeVocab, layoutVocab = {}, {}, {}
+  blobs = {'name': bytearray(), 'text': bytearray(), 'linkedNames': bytearray()}
+  offsets = {'name': [0], 'text': [0], 'linkedNames': [0]}
+  typeIds, typeOffsets = [], [0]
+  subtypeIds, subtypeOffsets = [], [0]
+  layoutIds, hasTypes, hasSubtypes, hasText = [], [], [], []
+
+  def appendString(column, value):
+    blobs[column].extend(value.encode('utf-8'))
+    offsets[column].append(len(blobs[column]))
+
+  for cardName, card in cards:
+    appendString('name', cardName)
+    appendString('text', card.get('text', ''))
+    appendString('linkedNames', ' - '.join(card['names']) if 'names' in card else '')
+    layoutIds.append(_vocabId(layoutVocab, card['layout']) if 'layout' in card else -1)
+    hasTypes.append('types' in card)
+    hasSubtypes.append('subtypes' in card)
+    hasText.append('text' in card)
+    typeIds.extend(_vocabId(typeVocab, type) for type in card.get('types', []))
+    typeOffsets.append(len(typeIds))
+    subtypeIds.extend(_vocabId(subtypeVocab, subtype) for subtype in card.get('subtypes', []))
+    subtypeOffsets.append(len(subtypeIds))
+
+  def ordered(vocab):
+    return sorted(vocab, key=vocab.get)
+
+  columns = {
+    'vocab': np.array(json.dumps({'types': ordered(typeVocab), 'subtypes': ordered(subtypeVocab),
+                                    'layouts': ordered(layoutVocab)})),
+    'layoutIds': np.array(layoutIds, dtype=np.int16),
+    'typeIds': np.array(typeIds, dtype=np.int32),
+    'typeOffsets': np.array(typeOffsets, dtype=np.int64),
+    'subtypeIds': np.array(subtypeIds, dtype=np.int32),
+    'subtypeOffsets': np.array(subtypeOffsets, dtype=np.int64),
+    'hasTypes': np.array(hasTypes, dtype=bool),
+    'hasSubtypes': np.array(hasSubtypes, dtype=bool),
+    'hasText': np.array(hasText, dtype=bool),
+  }
+  for column in blobs:
+    columns[column + 'Blob'] = np.frombuffer(bytes(blobs[column]), dtype=np.uint8)
+    columns[column + 'Offsets'] = np.array(offsets[column], dtype=np.int64)
+  return columns
+
+def _sourceStamp(jsonPath):
+  return np.array([CACHE_VERSION, getsize(jsonPath), int(getmtime(jsonPath) * 1e6)],
+                    dtype=np.int64)
+
+_loadedTables = {}
+
+def loadCardTable(jsonPath, cachePath=None):
+  '''
+  Loads the columnar card table for a card data json file. The json file is only read, one card
+    at a time, when the stored table is missing or the file's size or modification time has
+    changed
+  Inputs:
+    jsonPath: path to card data json file
+    cachePath: path to store the table at, if None will be jsonPath + '.table.npz' (None)
+  Outputs:
+    table: CardTable for the json file
+  '''
+  if not cachePath:
+    cachePath = jsonPath + '.table.npz'
+  stamp = _sourceStamp(jsonPath)
+
+  if jsonPath in _loadedTables and np.array_equal(_loadedTables[jsonPath][0], stamp):
+    return _loadedTables[jsonPath][1]
+
+  columns = None
+  if exists(cachePath):
+    stored = np.load(cachePath)
+    if np.array_equal(stored['stamp'], stamp):
+      columns = dict((key, stored[key]) for key in stored.files)
+    stored.close()
+  if columns is None:
+    columns = buildCardColumns(iterCards(jsonPath))
+    columns['stamp'] = stamp
+    tempPath = cachePath + '.tmp.npz'
+    np.savez(tempPath, **columns)
+    replace(tempPath, cachePath)
+
+  table = CardTable(columns)
+  _loadedTables[jsonPath] = (stamp, table)
+  return table
+
+def primaryTypeCategories(table, cutoffSize):
+  '''
+  Maps every card to a onehot category of its primary type, types with cutoffSize or fewer cards
+    share the 'Other' category
+  Inputs:
+    table: CardTable
+    cutoffSize: minimum size for a type to be included
+  Outputs:
+    categories: category of every card, indexed by card id
+    typeToCategory: map from type name to category, categories are numbered in order of the
+      type's first appearance as a primary type
+  '''
+  primary = table.primaryTypeIds()
+  hasPrimary = primary >= 0
+  counts = np.bincount(primary[hasPrimary], minlength=len(table.typeNames))
+  presentTypes, firstIndex = np.unique(primary[hasPrimary], return_index=True)
+  typeOrder = presentTypes[np.argsort(firstIndex)]
+  keptTypes = typeOrder[counts[typeOrder] > cutoffSize]
+
+  otherCategory = len(keptTypes)
+  # The extra last entry catches the -1 of cards without types
+  typeIdToCategory = np.full(len(table.typeNames) + 1, otherCategory, dtype=np.int32)
+  typeIdToCategory[keptTypes] = np.arange(len(keptTypes))
+
+  typeToCategory = dict((table.typeNames[typeId], category)
+                          for category, typeId in enumerate(keptTypes.tolist()))
+  typeToCategory['Other'] = otherCategory
+  return typeIdToCategory[primary], typeToCategory
+
+def _multiTypeEntries(table, cutoffSize):
+  '''
+  Counts every type and maps the type entries of all cards to categories, only types with more
+    than cutoffSize occurrences get a category
+  Outputs:
+    cardIds: card id of every type entry with a category
+    categories: category of every such entry
+    typeToCategory: map from type name to category, in order of the type's first appearance
+  '''
+  counts = np.bincount(table.typeIds, minlength=len(table.typeNames))
+  keptTypes = np.nonzero(counts > cutoffSize)[0]
+  typeIdToCategory = np.full(len(table.typeNames), -1, dtype=np.int32)
+  typeIdToCategory[keptTypes] = np.arange(len(keptTypes))
+
+  entryCategories = typeIdToCategory[table.typeIds]
+  valid = entryCategories >= 0
+  typeToCategory = dict((table.typeNames[typeId], category)
+                          for category, typeId in enumerate(keptTypes.tolist()))
+  return table.typeCardIds()[valid], entryCategories[valid], typeToCategory
+
+def multiTypeCategories(table, cutoffSize):
+  '''
+  Maps every card to a multihot encoding of its types, only types with more than cutoffSize
+    occurrences get a category
+  Inputs:
+    table: CardTable
+    cutoffSize: minimum size for a type to be included
+  Outputs:
+    categories: int8 array of shape (numCards, numCategories)
+    typeToCategory: map from type name to category, in order of the type's first appearance
+  '''
+  cardIds, entryCategories, typeToCategory = _multiTypeEntries(table, cutoffSize)
+  categories = np.zeros((len(table), len(typeToCategory)), dtype=np.int8)
+  categories[cardIds, entryCategories] = 1
+  return categories, typeToCategory
+
+def packedMultiTypeCategories(table, cutoffSize):
+  '''
+  Same as multiTypeCategories with the multihot encodings bit-packed, one bit per category
+  Inputs:
+    table: CardTable
+    cutoffSize: minimum size for a type to be included
+  Outputs:
+    labels: PackedLabels indexed by card id
+    typeToCategory: map from type name to category, in order of the type's first appearance
+  '''
+  cardIds, entryCategories, typeToCategory = _multiTypeEntries(table, cutoffSize)
+  return (PackedLabels.fromPairs(cardIds, entryCategories, len(table), len(typeToCategory)),
+            typeToCategory)
@@ -0,0 +1,167 @@
+from os import listdir, makedirs, remove, replace
+from os.path import exists, getmtime, getsize
+import hashlib
+import io
+import json
+import zlib
+
+from cardTable import loadCardTable
+from instrumentation import logger
+
+MANIFEST_FILE = 'manifest.json'
+
+def typeSubtypePrefix(card):
+  '''
+  Serializes a card's types and subtypes in the form 'type1,type2;subtype1,subtype2;'
+  Inputs:
+    card: card record with optional 'types' and 'subtypes' lists
+  Outputs:
+    prefix: serialized types and subtypes, empty if the card has neither
+  '''
+  prefix = ''
+  for field in ('types', 'subtypes'):
+    if field in card:
+      # An empty list drops the previous ';', as the original string building did
+      if card[field]:
+        prefix += ','.join(card[field]) + ';'
+      else:
+        prefix = prefix[:-1] + ';'
+  return prefix
+
+def typeSubtypeNameEntry(cardName, card):
+  '''
+  Serializes a card as 'type1,type2;subtype1,subtype2;name'
+  '''
+  return typeSubtypePrefix(card) + cardName
+
+def cardTextEntry(cardName, card):
+  '''
+  Serializes a card as 'type1,type2;subtype1,subtype2;cardText'
+  '''
+  return typeSubtypePrefix(card) + card.get('text', '')
+
+def iterCorpusEntries(jsonPath, formatEntry):
+  '''
+  Iterates over the serialized entries of every card
+  Inputs:
+    jsonPath: path to card data json file
+    formatEntry: function from (cardName, card) to the serialized entry
+  Outputs:
+    generator of (cardName, entry) tuples
+  '''
+  for cardName, card in loadCardTable(jsonPath).records():
+    yield cardName, formatEntry(cardName, card)
+
+def buildCorpus(jsonPath, formatEntry, separator='\n\n'):
+  '''
+  Builds a complete corpus string in one join instead of repeated concatenation
+  Inputs:
+    jsonPath: path to card data json file
+    formatEntry: function from (cardName, card) to the serialized entry
+    separator: string appended after every entry ('\n\n')
+  Outputs:
+    corpus: the complete corpus string
+  '''
+  return ''.join(entry + separator for _, entry in iterCorpusEntries(jsonPath, formatEntry))
+
+def writeCorpus(jsonPath, outputFile, formatEntry, separator='\n\n'):
+  '''
+  Streams a corpus to a single file without holding it in memory
+  Inputs:
+    jsonPath: path to card data json file
+    outputFile: path to file to write the corpus to
+    formatEntry: function from (cardName, card) to the serialized entry
+    separator: string appended after every entry ('\n\n')
+  '''
+  with io.open(outputFile, 'w', encoding='utf-8') as textFile:
+    textFile.writelines(entry + separator
+                          for _, entry in iterCorpusEntries(jsonPath, formatEntry))
+
+def _iterShards(entries, separator, shardSize):
+  '''
+  Groups serialized entries into shards of at most shardSize characters. Past half of shardSize a
+    shard is also cut after any card whose name hashes to 0 mod 16, so boundaries depend on the
+    cards themselves and adding a card only changes the shard it lands in
+  '''
+  parts = []
+  size = 0
+  for cardName, entry in entries:
+    parts.append(entry + separator)
+    size += len(parts[-1])
+    if size >= shardSize or (size >= shardSize // 2 and
+                              zlib.crc32(cardName.encode('utf-8')) % 16 == 0):
+      yield ''.join(parts), len(parts)
+      parts = []
+      size = 0
+  if parts:
+    yield ''.join(parts), len(parts)
+
+def buildCorpusShards(jsonPath, outputDir, formatEntry, separator='\n\n', shardSize=1 << 22):
+  '''
+  Streams a corpus into size-bounded shard files, only rewriting shards whose contents changed
+    since the last build. Nothing is serialized when the json file and the parameters are the same
+    as in the last build, formatEntry is compared by its module and name
+  Inputs:
+    jsonPath: path to card data json file
+    outputDir: directory to store shards and their manifest in
+    formatEntry: function from (cardName, card) to the serialized entry
+    separator: string appended after every entry ('\n\n')
+    shardSize: maximum number of characters per shard (4194304)
+  Outputs:
+    shardFiles: list of shard file paths in corpus order
+  '''
+  if not exists(outputDir):
+    makedirs(outputDir)
+  manifestPath = outputDir + '/' + MANIFEST_FILE
+  stamp = [getsize(jsonPath), getmtime(jsonPath), separator, shardSize,
+            '%s.%s' % (formatEntry.__module__, formatEntry.__name__)]
+  oldDigests = {}
+  if exists(manifestPath):
+    with io.open(manifestPath, encoding='utf-8') as manifestFile:
+      stored = json.load(manifestFile)
+    shardFiles = [outputDir + '/' + shard['file'] for shard in stored['shards']]
+    if stored.get('stamp') == stamp and all(exists(shardFile) for shardFile in shardFiles):
+      logger.info('Corpus shards: %d unchanged', len(shardFiles))
+      return shardFiles
+    oldDigests = dict((shard['file'], shard['digest']) for shard in stored['shards'])
+
+  shards = []
+  numWritten = 0
+  entries = iterCorpusEntries(jsonPath, formatEntry)
+  for index, (text, numEntries) in enumerate(_iterShards(entries, separator, shardSize)):
+    fileName = 'shard-%05d.txt' % index
+    data = text.encode('utf-8')
+    digest = hashlib.sha1(data).hexdigest()
+    if oldDigests.get(fileName) != digest or not exists(outputDir + '/' + fileName):
+      with open(outputDir + '/' + fileName + '.tmp', 'wb') as shardFile:
+        shardFile.write(data)
+      replace(outputDir + '/' + fileName + '.tmp', outputDir + '/' + fileName)
+      numWritten += 1
+    shards.append({'file': fileName, 'digest': digest, 'entries': numEntries})
+
+  shardNames = set(shard['file'] for shard in shards)
+  for fileName in listdir(outputDir):
+    if fileName.startswith('shard-') and fileName not in shardNames:
+      remove(outputDir + '/' + fileName)
+  with io.open(manifestPath + '.tmp', 'w', encoding='utf-8') as manifestFile:
+    json.dump({'stamp': stamp, 'separator': separator, 'shards': shards}, manifestFile)
+  replace(manifestPath + '.tmp', manifestPath)
+
+  logger.info('Corpus shards: %d written, %d unchanged', numWritten, len(shards) - numWritten)
+  return [outputDir + '/' + shard['file'] for shard in shards]
+
+def readCorpusShards(outputDir):
+  '''
+  Reads a sharded corpus back into a single string
+  Inputs:
+    outputDir: directory the shards and their manifest are stored in
+  Outputs:
+    corpus: the complete corpus string
+  '''
+  with io.open(outputDir + '/' + MANIFEST_FILE, encoding='utf-8') as manifestFile:
+    shards = json.load(manifestFile)['shards']
+  parts = []
+  for shard in shards:
+    with io.open(outputDir + '/' + shard['file'], encoding='utf-8') as shardFile:
+      parts.append(shardFile.read())
+  return ''.join(parts)
@@ -0,0 +1,179 @@
+from os import listdir
+from os.path import basename, dirname, exists, getmtime, join
+from multiprocessing import Pool
+import io
+import json
+import numpy as np
+
+from artCache import IMAGES_FILE
+from instrumentation import logger
+
+STATS_FILE = 'stats.json'
+# Appended to a checkpoint's model path, holds the statistics that model was trained with
+MODEL_STATS_SUFFIX = '.stats.json'
+# TensorFlow writes one of these for every saved checkpoint
+CHECKPOINT_SUFFIX = '.meta'
+
+# Statistics of the original 64x64 art set, used when a dataset has no stored statistics
+DEFAULT_MEAN = 102.59733902
+DEFAULT_STD = 65.9076363382
+
+def chunkMoments(images):
+  '''
+  Computes per-channel pixel count, mean and sum of squared deviations of a chunk of images
+  Inputs:
+    images: uint8 array of shape (numImages, height, width[, channels])
+  Outputs:
+    count: number of pixels per channel
+    mean: float64 array of per-channel means
+    m2: float64 array of per-channel sums of squared deviations from the mean
+  '''
+  pixels = np.asarray(images, dtype=np.float64)
+  pixels = pixels.reshape(-1, pixels.shape[-1] if pixels.ndim == 4 else 1)
+  mean = pixels.mean(axis=0)
+  m2 = ((pixels - mean) ** 2).sum(axis=0)
+  return len(pixels), mean, m2
+
+def mergeMoments(first, second):
+  '''
+  Merges two (count, mean, m2) moments with Chan et al.'s pairwise update, which stays
+    numerically stable where a running sum of squares would not
+  '''
+  countA, meanA, m2A = first
+  countB, meanB, m2B = second
+  count = countA + countB
+  if count == 0:
+    return first
+  delta = meanB - meanA
+  mean = meanA + delta * (countB / count)
+  m2 = m2A + m2B + delta ** 2 * (countA * countB / count)
+  return count, mean, m2
+
+def _cacheChunkMoments(job):
+  cachePath, start, stop = job
+  images = np.load(cachePath + '/' + IMAGES_FILE, mmap_mode='r')
+  return chunkMoments(images[start:stop])
+
+def computeDatasetStats(cachePath, chunkSize=2048, numWorkers=1):
+  '''
+  Computes global and per-channel pixel mean and standard deviation of an art cache in one pass
+    over the memory-mapped images, splitting the work into chunks processed in parallel, and
+    stores them next to the dataset
+  Inputs:
+    cachePath: directory of the art cache
+    chunkSize: number of images per chunk (2048)
+    numWorkers: number of worker processes (1)
+  Outputs:
+    stats: dictionary with 'mean', 'std', 'channelMean', 'channelStd' and 'count'
+  '''
+  numImages = len(np.load(cachePath + '/' + IMAGES_FILE, mmap_mode='r'))
+  jobs = [(cachePath, start, min(start + chunkSize, numImages))
+            for start in range(0, numImages, chunkSize)]
+  if numWorkers > 1:
+    pool = Pool(numWorkers)
+    try:
+      moments = pool.imap(_cacheChunkMoments, jobs)
+      total = next(moments)
+      for chunk in moments:
+        total = mergeMoments(total, chunk)
+    finally:
+      pool.close()
+      pool.join()
+  else:
+    total = _cacheChunkMoments(jobs[0])
+    for job in jobs[1:]:
+      total = mergeMoments(total, _cacheChunkMoments(job))
+
+  count, channelMean, channelM2 = total
+  # Channels have equal pixel counts, so the global moments merge the channels the same way
+  globalMoments = (count, channelMean[:1], channelM2[:1])
+  for channel in range(1, len(channelMean)):
+    globalMoments = mergeMoments(globalMoments,
+                                  (count, channelMean[channel:channel + 1],
+                                    channelM2[channel:channel + 1]))
+  globalCount, globalMean, globalM2 = globalMoments
+
+  stats = {
+    'mean': float(globalMean[0]),
+    'std': float(np.sqrt(globalM2[0] / globalCount)),
+    'channelMean': channelMean.tolist(),
+    'channelStd': np.sqrt(channelM2 / count).tolist(),
+    'count': int(count),
+  }
+  with io.open(cachePath + '/' + STATS_FILE, 'w', encoding='utf-8') as statsFile:
+    json.dump(stats, statsFile)
+  return stats
+
+def loadDatasetStats(cachePath):
+  '''
+  Loads the stored statistics of an art cache
+  Inputs:
+    cachePath: directory of the art cache, may be None
+  Outputs:
+    mean: global pixel mean, DEFAULT_MEAN if no statistics are stored
+    std: global pixel standard deviation, DEFAULT_STD if no statistics are stored
+  '''
+  if not cachePath or not exists(cachePath + '/' + STATS_FILE):
+    return DEFAULT_MEAN, DEFAULT_STD
+  with io.open(cachePath + '/' + STATS_FILE, encoding='utf-8') as statsFile:
+    stats = json.load(statsFile)
+  return stats['mean'], stats['std']
+
+def datasetStatsExist(cachePath):
+  '''
+  Returns True if statistics are stored for the art cache at cachePath, False otherwise
+  '''
+  return exists(cachePath + '/' + STATS_FILE)
+
+def checkpointModelPaths(checkpointPath):
+  '''
+  Returns the model paths of the checkpoints saved under a checkpoint path prefix, e.g.
+    './best_classifier_checkpoints9533' for the prefix './best_classifier_checkpoints'
+  '''
+  directory = dirname(checkpointPath) or '.'
+  prefix = basename(checkpointPath)
+  if not exists(directory):
+    return []
+  return [join(directory, fileName[:-len(CHECKPOINT_SUFFIX)]) for fileName in listdir(directory)
+            if fileName.startswith(prefix) and fileName.endswith(CHECKPOINT_SUFFIX)]
+
+def saveModelStats(checkpointPaths, since, datasetPath=None):
+  '''
+  Stores the normalization statistics a model was trained with next to every checkpoint it saved,
+    so a checkpoint loaded later normalizes its inputs the same way. Checkpoints saved before the
+    model's training started belong to other models and are left alone
+  Inputs:
+    checkpointPaths: checkpoint path prefixes of the model, e.g. './classifier_checkpoints/'
+    since: time the model's training started, as from time.time()
+    datasetPath: directory of the art cache the model was trained with, may be None (None)
+  Outputs:
+    modelPaths: model paths of the checkpoints the statistics were stored for
+  '''
+  mean, std = loadDatasetStats(datasetPath)
+  modelPaths = [modelPath for checkpointPath in checkpointPaths
+                  for modelPath in checkpointModelPaths(checkpointPath)
+                  if getmtime(modelPath + CHECKPOINT_SUFFIX) >= since]
+  for modelPath in modelPaths:
+    with io.open(modelPath + MODEL_STATS_SUFFIX, 'w', encoding='utf-8') as statsFile:
+      json.dump({'mean': mean, 'std': std, 'datasetPath': datasetPath}, statsFile)
+  return modelPaths
+
+def loadModelStats(modelPath, datasetPath=None):
+  '''
+  Loads the normalization statistics stored with a trained model's checkpoint by saveModelStats
+  Inputs:
+    modelPath: path to trained model
+    datasetPath: directory of the art cache the model was trained with, only used for checkpoints
+      saved without statistics (None)
+  Outputs:
+    mean: global pixel mean
+    std: global pixel standard deviation
+  '''
+  statsPath = modelPath + MODEL_STATS_SUFFIX
+  if not exists(statsPath):
+    logger.warning('No normalization statistics stored with %s, using those of %s', modelPath,
+                    datasetPath or 'the original art set')
+    return loadDatasetStats(datasetPath)
+  with io.open(statsPath, encoding='utf-8') as statsFile:
+    stats = json.load(statsFile)
+  return stats['mean'], stats['std']
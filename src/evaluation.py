@@ -0,0 +1,52 @@
+import numpy as np
+
+def predictInBatches(model, inputs, batchSize=256, stage=None):
+  '''
+  Runs a model over inputs in batches instead of one sample per call
+  Inputs:
+    model: trained model with a predict method
+    inputs: array or list of input samples
+    batchSize: number of samples per predict call (256)
+    stage: instrumentation Stage to record per-batch predict latency and progress in (None)
+  Outputs:
+    predictions: float32 array of shape (numSamples, numCategories)
+  '''
+  predictions = []
+  for start in range(0, len(inputs), batchSize):
+    batch = np.asarray(inputs[start:start + batchSize], dtype=np.float32)
+    if stage is None:
+      predictions.append(np.asarray(model.predict(batch), dtype=np.float32))
+    else:
+      with stage.step('predict'):
+        predictions.append(np.asarray(model.predict(batch), dtype=np.float32))
+      stage.tick(len(batch))
+  return np.concatenate(predictions)
+
+def confusionMatrix(actual, predicted, numCategories):
+  '''
+  Counts predictions per (actual, predicted) category pair
+  Inputs:
+    actual: array of actual categories
+    predicted: array of predicted categories
+    numCategories: total number of categories
+  Outputs:
+    matrix: int array of shape (numCategories, numCategories), rows are actual categories
+  '''
+  pairs = np.asarray(actual) * numCategories + np.asarray(predicted)
+  return np.bincount(pairs, minlength=numCategories ** 2).reshape(numCategories, numCategories)
+
+def printConfusionMatrix(matrix, categoryToType):
+  '''
+  Prints a confusion matrix with per-category recall
+  Inputs:
+    matrix: confusion matrix from confusionMatrix
+    categoryToType: map from category number to type name
+  '''
+  labels = [categoryToType[category] for category in range(len(matrix))]
+  width = max(max(len(label) for label in labels), 7)
+  print(' ' * width + ' ' + ' '.join(label[:7].rjust(7) for label in labels) + '  Recall')
+  totals = matrix.sum(axis=1)
+  for category, label in enumerate(labels):
+    recall = matrix[category, category] * 100 / totals[category] if totals[category] else 0
+    print(label.rjust(width) + ' ' + ' '.join('%7d' % count for count in matrix[category]) +
+            ' %6.2f%%' % recall)
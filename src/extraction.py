@@ -0,0 +1,457 @@
+from os import listdir, makedirs, remove, replace, stat
+from os.path import exists
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from PIL import Image, ImageFilter
+import hashlib
+import io
+import json
+import math
+import random
+import time
+
+from instrumentation import Stage, logger
+
+TEMP_PREFIX = '.tmp_'
+ART_MANIFEST = '.artManifest.json'
+DECODE_MODES = ('full', 'draft')
+# Proportion of the scan height taken by the artwork box, the side of the square art crop
+ART_HEIGHT = 0.42
+
+def cropArtBox(card):
+  '''
+  Crops the square center of the artwork box out of a card scan
+  Inputs:
+    card: PIL image of a full card scan
+  Outputs:
+    art: PIL image of the square center of the card's artwork box, at scan resolution
+  '''
+  width, height = card.size
+  artWidth, artHeight = (width * 0.76, height * ART_HEIGHT)
+  widthBorder = (width - artWidth) / 2
+  heightBorder = widthBorder * 1.5
+  art = card.crop((widthBorder, heightBorder, widthBorder + artWidth, heightBorder + artHeight))
+  squareBorder = (artWidth - artHeight) / 2
+  return art.crop((squareBorder, 0, squareBorder + artHeight, artHeight))
+
+def artBox(scanSize, scale=1):
+  '''
+  Locates the pixels cropArtBox crops out of a card scan, rounded the same way, optionally in the
+    coordinates of a reduced decode of the scan
+  Inputs:
+    scanSize: (width, height) of the full resolution card scan in pixels
+    scale: reduction factor of the decoded image the box is used on (1)
+  Outputs:
+    box: (left, upper, right, lower) coordinates of the art
+  '''
+  width, height = scanSize
+  artWidth, artHeight = (width * 0.76, height * ART_HEIGHT)
+  widthBorder = (width - artWidth) / 2
+  heightBorder = widthBorder * 1.5
+  squareBorder = (artWidth - artHeight) / 2
+  left = round(widthBorder) + round(squareBorder)
+  upper = round(heightBorder)
+  box = (left, upper, left + round(squareBorder + artHeight) - round(squareBorder),
+          upper + round(heightBorder + artHeight) - upper)
+  return tuple(coordinate / scale for coordinate in box)
+
+def cropCardArt(card, image_width, image_height):
+  '''
+  Crops the artwork section out of a card scan and resizes it
+  Inputs:
+    card: PIL image of a full card scan
+    image_width: width in pixels of final artwork
+    image_height: height in pixels of final artwork
+  Outputs:
+    art: PIL image of the square center of the card's artwork box
+  '''
+  return cropArtBox(card).resize((image_width, image_height))
+
+def decodeScan(scanPath, image_width, image_height, decode='full'):
+  '''
+  Opens and decodes a card scan. In 'draft' mode codecs that support scaled decoding (jpeg, at
+    1/2, 1/4 or 1/8 scale) decode at the smallest scale whose art still covers the target size,
+    so most of the pixels that would be thrown away are never decoded. Other formats, and scans
+    too small to reduce, fall back to a full decode
+  Inputs:
+    scanPath: path to the card scan
+    image_width: width in pixels of final artwork
+    image_height: height in pixels of final artwork
+    decode: 'full' or 'draft' ('full')
+  Outputs:
+    card: decoded PIL image of the card scan
+    box: coordinates of the art in card's pixels for a reduced decode, see artBox, None for a
+      full decode
+  '''
+  if decode not in DECODE_MODES:
+    raise ValueError('decode must be one of %s, got %r' % (DECODE_MODES, decode))
+  card = Image.open(scanPath)
+  box = None
+  if decode == 'draft':
+    width, height = card.size
+    target = max(image_width, image_height) / (height * ART_HEIGHT)
+    if target < 1:
+      drafted = card.draft(card.mode, (int(math.ceil(width * target)),
+                                        int(math.ceil(height * target))))
+      if drafted is not None:
+        # A reduced decode can be padded by part of a pixel, so the scale comes from the region
+        # covering the scan rather than from the decoded size
+        box = artBox((width, height), width / drafted[1][2])
+  card.load()
+  return card, box
+
+def cropDecodedArt(card, box):
+  '''
+  Crops the art of a card decoded by decodeScan, once for every resolution made from it. A full
+    decode is cropped with cropArtBox, so resizing the art gives the same pixels as cropCardArt.
+    A reduced decode is cropped to the whole pixels around its fractional art box and the box is
+    kept for resizing, since rounding the crop to whole reduced pixels would shift the art by up
+    to 8 scan pixels. Against a full decode the reduced art differs by a mean absolute error of 1
+    to 4 levels out of 255 on blurred noise scans, and up to 6 on synthetic high contrast block
+    scans
+  Inputs:
+    card: PIL image from decodeScan
+    box: art box from decodeScan
+  Outputs:
+    art: PIL image of the card's art
+    box: box of the art within art to resize from, None if it is the whole image
+  '''
+  if box is None:
+    return cropArtBox(card), None
+  left, upper = int(box[0]), int(box[1])
+  art = card.crop((left, upper, min(int(math.ceil(box[2])), card.size[0]),
+                    min(int(math.ceil(box[3])), card.size[1])))
+  return art, (box[0] - left, box[1] - upper, box[2] - left, box[3] - upper)
+
+def resolutionDirectory(image_width, image_height=None, grayscale=False):
+  '''
+  Returns the name of the subdirectory holding one resolution of a multi-resolution art directory,
+    e.g. '64x64' or '64x64_gray'
+  '''
+  return '%dx%d%s' % (image_width, image_height or image_width, '_gray' if grayscale else '')
+
+def artResolutionPath(artPath, image_width, image_height=None, grayscale=False):
+  '''
+  Returns the path of one resolution of a multi-resolution art directory, for the art loaders
+  Inputs:
+    artPath: path to the card art directory extractArt was given resolutions for, ending in '/'
+    image_width: width in pixels of the artwork
+    image_height: height in pixels of the artwork, if None will be set to image_width (None)
+    grayscale: boolean for whether to use the grayscale copy (False)
+  '''
+  return artPath + resolutionDirectory(image_width, image_height, grayscale) + '/'
+
+def artVariants(image_width, image_height, grayscale, resolutions=None, grayscaleCopies=False):
+  '''
+  Lists the images made from every card scan
+  Inputs:
+    image_width: width in pixels of the artwork, if resolutions is None
+    image_height: height in pixels of the artwork, if resolutions is None
+    grayscale: boolean for whether artwork is only stored as grayscale
+    resolutions: list of widths or (width, height) pairs to store, each in its own subdirectory,
+      if None a single resolution is stored in the art directory itself (None)
+    grayscaleCopies: boolean for whether to also store a grayscale copy of every resolution,
+      used with resolutions (False)
+  Outputs:
+    variants: list of [subdirectory, width, height, grayscale] lists, subdirectory is '' or ends
+      in '/'
+  '''
+  if resolutions is None:
+    return [['', image_width, image_height, bool(grayscale)]]
+  if grayscale:
+    grays = [True]
+  else:
+    grays = [False, True] if grayscaleCopies else [False]
+  variants = []
+  for resolution in resolutions:
+    if isinstance(resolution, (list, tuple)):
+      width, height = resolution
+    else:
+      width, height = resolution, resolution
+    for gray in grays:
+      variants.append([resolutionDirectory(width, height, gray) + '/', width, height, gray])
+  return variants
+
+def artOutputNames(cardPath, flip=False, blur=False, variants=None):
+  '''
+  Lists the art files produced for a single card scan
+  Inputs:
+    cardPath: file name of the card scan
+    flip: whether a flipped duplicate is stored (False)
+    blur: whether blurred duplicates are stored (False)
+    variants: list of variants from artVariants, if None a single resolution is stored in the art
+      directory itself (None)
+  Outputs:
+    names: list of output file names relative to the art directory, for every variant the
+      unmodified art first
+  '''
+  names = []
+  for subdirectory in [variant[0] for variant in variants or [['']]]:
+    names.append(subdirectory + cardPath)
+    if flip:
+      names.append(subdirectory + 'flip_' + cardPath)
+    if blur:
+      names.append(subdirectory + 'blur_' + cardPath)
+      if flip:
+        names.append(subdirectory + 'blur_flip_' + cardPath)
+  return names
+
+def saveAtomically(image, outputPath, fileName):
+  '''
+  Saves an image under a temporary name and renames it into place, so an interrupted run never
+    leaves a partially written file under its final name
+  Inputs:
+    image: PIL image to save
+    outputPath: directory to save into, ending in '/'
+    fileName: final file name
+  '''
+  tempPath = outputPath + TEMP_PREFIX + fileName
+  image.save(tempPath)
+  replace(tempPath, outputPath + fileName)
+
+def extractCardArt(job):
+  '''
+  Extracts and saves the artwork (and optional flip/blur variants) of a single card scan at every
+    resolution, decoding and cropping the scan once
+  Inputs:
+    job: tuple of (cardsPath, outputPath, cardPath, variants, flip, blur, decode), variants from
+      artVariants
+  Outputs:
+    cardPath: file name of the processed card scan
+    latencies: dictionary of seconds spent in the decode, crop, resize and save steps
+  '''
+  cardsPath, outputPath, cardPath, variants, flip, blur, decode = job
+  startTime = time.time()
+  card, box = decodeScan(cardsPath + cardPath, max(variant[1] for variant in variants),
+                          max(variant[2] for variant in variants), decode)
+  decodeTime = time.time()
+  cropped, box = cropDecodedArt(card, box)
+  cropTime = time.time()
+  latencies = {'decode': decodeTime - startTime, 'crop': cropTime - decodeTime, 'resize': 0,
+                'save': 0}
+  for subdirectory, image_width, image_height, grayscale in variants:
+    resizeStart = time.time()
+    art = cropped.resize((image_width, image_height), box=box)
+    if grayscale:
+      art = art.convert('L')
+    saveStart = time.time()
+    variantPath = outputPath + subdirectory
+    saveAtomically(art, variantPath, cardPath)
+    if flip:
+      flipped = art.transpose(Image.FLIP_LEFT_RIGHT)
+      saveAtomically(flipped, variantPath, 'flip_' + cardPath)
+    if blur:
+      blurred = art.filter(ImageFilter.GaussianBlur(radius=0.6))
+      saveAtomically(blurred, variantPath, 'blur_' + cardPath)
+      if flip:
+        blurFlip = flipped.filter(ImageFilter.GaussianBlur(radius=0.8))
+        saveAtomically(blurFlip, variantPath, 'blur_flip_' + cardPath)
+    latencies['resize'] += saveStart - resizeStart
+    latencies['save'] += time.time() - saveStart
+  return cardPath, latencies
+
+def fileDigest(path, chunkSize=1 << 20):
+  '''
+  Returns the sha1 hex digest of a file's contents
+  '''
+  digest = hashlib.sha1()
+  with open(path, 'rb') as inputFile:
+    for chunk in iter(lambda: inputFile.read(chunkSize), b''):
+      digest.update(chunk)
+  return digest.hexdigest()
+
+def loadArtManifest(outputPath):
+  '''
+  Reads the manifest of an art directory written by an incremental extractArt run
+  Inputs:
+    outputPath: art directory, ending in '/'
+  Outputs:
+    manifest: dictionary with the extraction 'params' and 'scans', a dictionary from scan file name
+      to its 'size', 'mtime', sha1 'hash' and the 'outputs' made from it
+  '''
+  if not exists(outputPath + ART_MANIFEST):
+    return {'params': None, 'scans': {}}
+  with io.open(outputPath + ART_MANIFEST, encoding='utf-8') as manifestFile:
+    return json.load(manifestFile)
+
+def saveArtManifest(outputPath, manifest):
+  '''
+  Writes the manifest of an art directory atomically
+  '''
+  tempPath = outputPath + TEMP_PREFIX + ART_MANIFEST
+  with io.open(tempPath, 'w', encoding='utf-8') as manifestFile:
+    manifestFile.write(json.dumps(manifest))
+  replace(tempPath, outputPath + ART_MANIFEST)
+
+def planIncremental(cardsPath, outputPath, cardPaths, params, manifest):
+  '''
+  Compares scans against an art manifest and removes the outputs that are out of date. A scan is
+    unchanged if all its outputs exist and its size and mtime match its entry, or failing that its
+    sha1 does. Outputs of scans that were deleted, or made with different parameters, are
+    removed, and the manifest is updated to match
+  Inputs:
+    cardsPath: path to card scans
+    outputPath: art directory, ending in '/'
+    cardPaths: file names of the scans to consider
+    params: dictionary of the extraction parameters of this run
+    manifest: manifest from loadArtManifest, updated in place
+  Outputs:
+    changed: dictionary from the file name of every new or changed scan to its manifest entry,
+      entries are added to the manifest once the scan is processed
+    numRemoved: number of stale outputs removed
+  '''
+  staleOutputs = set()
+  if manifest['params'] != params:
+    for entry in manifest['scans'].values():
+      staleOutputs.update(entry['outputs'])
+    manifest['params'] = params
+    manifest['scans'] = {}
+  scans = manifest['scans']
+
+  changed = {}
+  for cardPath in cardPaths:
+    scanStat = stat(cardsPath + cardPath)
+    entry = scans.get(cardPath)
+    if entry and not all(exists(outputPath + output) for output in entry['outputs']):
+      # An output was deleted since the scan was processed, so the scan is processed again
+      staleOutputs.update(scans.pop(cardPath)['outputs'])
+      entry = None
+    if entry and entry['size'] == scanStat.st_size and entry['mtime'] == scanStat.st_mtime:
+      continue
+    digest = fileDigest(cardsPath + cardPath)
+    if entry and entry['size'] == scanStat.st_size and entry['hash'] == digest:
+      entry['mtime'] = scanStat.st_mtime
+      continue
+    if entry:
+      staleOutputs.update(entry['outputs'])
+      del scans[cardPath]
+    changed[cardPath] = {'size': scanStat.st_size, 'mtime': scanStat.st_mtime, 'hash': digest,
+                          'outputs': artOutputNames(cardPath, params['flip'], params['blur'],
+                                              params['variants'])}
+
+  currentScans = set(listdir(cardsPath))
+  for cardPath in [cardPath for cardPath in scans if cardPath not in currentScans]:
+    staleOutputs.update(scans.pop(cardPath)['outputs'])
+
+  # Outputs that will be rewritten are replaced atomically rather than removed
+  for entry in changed.values():
+    staleOutputs.difference_update(entry['outputs'])
+  numRemoved = 0
+  for fileName in staleOutputs:
+    if exists(outputPath + fileName):
+      remove(outputPath + fileName)
+      numRemoved += 1
+  return changed, numRemoved
+
+def extractArt(cardsPath, artPath='art', image_width=64, image_height=None, flip=False,
+                blur=False, grayscale=False, proportion=1, numWorkers=1, maxInFlight=None,
+                resume=True, decode='full', incremental=False, resolutions=None,
+                grayscaleCopies=False):
+  '''
+  Extracts card artwork from every card scan, optionally fanning the scans out over a pool of
+    worker processes. Finished files are written atomically, so an interrupted run can be started
+    again and will skip the scans whose outputs already exist. In incremental mode a manifest of
+    every scan's size, mtime and hash and of the extraction parameters is kept in the art
+    directory, only new or changed scans are processed and the outputs of deleted scans removed.
+    Given several resolutions, every one is made from a single decode and crop per scan and
+    stored in its own subdirectory, see artResolutionPath
+  Inputs:
+    cardsPath: path to magic the gathering card scans
+    artPath: subpath to be appended to cardsPath after '../' to store card art ('art')
+    image_width: width in pixels of final artwork (64)
+    image_height: height in pixels of final artwork, if None will be set to image_width (None)
+    flip: boolean for whether to store a flipped duplicate card art (False)
+    blur: boolean for whether to store blurred duplicate card art (False)
+    grayscale: boolean for whether to save card art only as grayscale (False)
+    proportion: proportion of cards to create artwork for, for testing (1)
+    numWorkers: number of worker processes, 1 processes scans in this process (1)
+    maxInFlight: maximum number of scans submitted to the pool at once, if None will be set to
+      4 * numWorkers (None)
+    resume: boolean for whether to skip scans whose outputs already exist (True)
+    decode: 'full' decodes every scan at full resolution, 'draft' decodes jpeg scans at a reduced
+      resolution that still covers the output size, see decodeScan ('full')
+    incremental: boolean for whether to process only scans that are new or changed since the
+      last incremental run, replaces the existence check of resume (False)
+    resolutions: list of widths or (width, height) pairs to store in subdirectories named like
+      '64x64', replacing image_width and image_height (None)
+    grayscaleCopies: boolean for whether to also store a grayscale copy of every resolution in
+      subdirectories named like '64x64_gray', used with resolutions (False)
+  Outputs:
+    numProcessed: number of card scans processed by this run
+  '''
+  if not image_height:
+    image_height = image_width
+  if not maxInFlight:
+    maxInFlight = 4 * numWorkers
+  if decode not in DECODE_MODES:
+    raise ValueError('decode must be one of %s, got %r' % (DECODE_MODES, decode))
+  outputPath = cardsPath + '../' + artPath + '/'
+  variants = artVariants(image_width, image_height, grayscale, resolutions, grayscaleCopies)
+
+  existing = set()
+  for subdirectory in [variant[0] for variant in variants]:
+    if not exists(outputPath + subdirectory):
+      makedirs(outputPath + subdirectory)
+    for fileName in listdir(outputPath + subdirectory):
+      if fileName.startswith(TEMP_PREFIX):
+        remove(outputPath + subdirectory + fileName)
+      else:
+        existing.add(subdirectory + fileName)
+
+  cards = listdir(cardsPath)
+  cardPaths = [cardPath for cardPath in cards
+                if not cardPath.startswith('.') and random.random() < proportion]
+  numSelected = len(cardPaths)
+  if incremental:
+    manifest = loadArtManifest(outputPath)
+    params = {'variants': variants, 'flip': flip, 'blur': blur, 'decode': decode}
+    changed, numRemoved = planIncremental(cardsPath, outputPath, cardPaths, params, manifest)
+    cardPaths = [cardPath for cardPath in cardPaths if cardPath in changed]
+    logger.info('Generating Card Art: removed %d stale outputs', numRemoved)
+  elif resume:
+    cardPaths = [cardPath for cardPath in cardPaths
+                  if not all(name in existing
+                              for name in artOutputNames(cardPath, flip, blur, variants))]
+  jobs = [(cardsPath, outputPath, cardPath, variants, flip, blur, decode)
+            for cardPath in cardPaths]
+
+  def finished(cardPath, latencies):
+    if incremental:
+      manifest['scans'][cardPath] = changed[cardPath]
+    stage.recordAll(latencies)
+    stage.tick()
+
+  # Only scans skipped as up to date count, not dot files or scans left out by proportion
+  logger.info('Generating Card Art: %d scans to process, %d skipped as up to date', len(jobs),
+                numSelected - len(jobs))
+  try:
+    with Stage('extractArt', total=len(jobs)) as stage:
+      if numWorkers <= 1:
+        for job in jobs:
+          finished(*extractCardArt(job))
+      else:
+        executor = ProcessPoolExecutor(max_workers=numWorkers)
+        pending = set()
+        jobIter = iter(jobs)
+        try:
+          while True:
+            for job in jobIter:
+              pending.add(executor.submit(extractCardArt, job))
+              if len(pending) >= maxInFlight:
+                break
+            if not pending:
+              break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+              finished(*future.result())
+        except KeyboardInterrupt:
+          for future in pending:
+            future.cancel()
+          logger.warning('Interrupted after %d scans, run again to resume', stage.count)
+          raise
+        finally:
+          executor.shutdown(wait=True)
+  finally:
+    # Scans finished before an interruption are recorded, the rest are retried on the next run
+    if incremental:
+      saveArtManifest(outputPath, manifest)
+  return stage.count
@@ -0,0 +1,158 @@
+from contextlib import contextmanager
+import cProfile
+import io
+import json
+import logging
+import time
+import numpy as np
+
+logger = logging.getLogger('mtgenerator')
+
+_settings = {'metricsPath': None, 'profileDir': None, 'profiling': False}
+
+def _installHandler(handler, level):
+  handler.setFormatter(logging.Formatter('%(asctime)s %(name)s %(levelname)s %(message)s'))
+  logger.handlers = [handler]
+  logger.setLevel(level)
+  logger.propagate = False
+
+# Progress is reported on stderr at INFO until configureInstrumentation is called, so scripts
+# and REPL sessions see the same progress output the pipeline always printed
+if not logger.handlers:
+  _installHandler(logging.StreamHandler(), logging.INFO)
+
+def configureInstrumentation(level=logging.INFO, logPath=None, metricsPath=None,
+                              profileDir=None):
+  '''
+  Sets where stage progress and metrics are reported
+  Inputs:
+    level: logging level for progress messages (logging.INFO)
+    logPath: file to write progress messages to, if None they go to stderr (None)
+    metricsPath: file to append one json line of metrics per finished stage to (None)
+    profileDir: directory to write a cProfile dump per outermost stage to, stages nested in a
+      profiled stage are part of its dump, profiling is off if None (None)
+  '''
+  _installHandler(logging.FileHandler(logPath) if logPath else logging.StreamHandler(), level)
+  _settings['metricsPath'] = metricsPath
+  _settings['profileDir'] = profileDir
+
+class Stage(object):
+  '''
+  Measures one stage of the pipeline: wall time, items per second and per-item latency of named
+    steps. Progress is logged at most every logInterval seconds and a summary is logged, and
+    written to the metrics file if configured, when the stage finishes. Used as a context manager:
+
+    with Stage('generatePics', total=len(cards)) as stage:
+      for card in cards:
+        with stage.step('decode'):
+          ...
+        stage.tick()
+  '''
+  def __init__(self, name, total=None, logInterval=10.0):
+    '''
+    Inputs:
+      name: stage name used in logs and metrics
+      total: expected number of items, for percent done (None)
+      logInterval: minimum number of seconds between progress messages (10.0)
+    '''
+    self.name = name
+    self.total = total
+    self.logInterval = logInterval
+    self.count = 0
+    self.latencies = {}
+    self.profiler = None
+
+  def __enter__(self):
+    self.startTime = time.time()
+    self.lastLog = self.startTime
+    # Only one profiler can be active at a time, so nested stages are covered by the outer one
+    if _settings['profileDir'] and not _settings['profiling']:
+      profiler = cProfile.Profile()
+      try:
+        profiler.enable()
+      except ValueError as error:
+        logger.warning('%s: not profiled, another profiler is active (%s)', self.name, error)
+      else:
+        self.profiler = profiler
+        _settings['profiling'] = True
+    logger.info('%s: started%s', self.name,
+                  '' if self.total is None else ' (%d items)' % self.total)
+    return self
+
+  def __exit__(self, excType, excValue, traceback):
+    if self.profiler is not None:
+      self.profiler.disable()
+      _settings['profiling'] = False
+      self.profiler.dump_stats('%s/%s.prof' % (_settings['profileDir'], self.name))
+    self.finish(failed=excType is not None)
+    return False
+
+  def tick(self, count=1):
+    '''
+    Marks count more items as processed
+    '''
+    self.count += count
+    now = time.time()
+    if now - self.lastLog >= self.logInterval:
+      self.lastLog = now
+      rate = self.count / max(now - self.startTime, 1e-9)
+      if self.total:
+        logger.info('%s: %2.1f%% (%d/%d), %.1f items/sec', self.name,
+                      self.count * 100 / self.total, self.count, self.total, rate)
+      else:
+        logger.info('%s: %d items, %.1f items/sec', self.name, self.count, rate)
+
+  def record(self, stepName, seconds):
+    '''
+    Records the latency of one item for a named step
+    '''
+    self.latencies.setdefault(stepName, []).append(seconds)
+
+  def recordAll(self, latencies):
+    '''
+    Records latencies measured elsewhere, e.g. in a worker process
+    Inputs:
+      latencies: dictionary from step name to a latency or list of latencies in seconds
+    '''
+    for stepName, seconds in latencies.items():
+      if isinstance(seconds, (list, tuple)):
+        self.latencies.setdefault(stepName, []).extend(seconds)
+      else:
+        self.record(stepName, seconds)
+
+  @contextmanager
+  def step(self, stepName):
+    '''
+    Context manager timing one item of a named step
+    '''
+    startTime = time.time()
+    try:
+      yield
+    finally:
+      self.record(stepName, time.time() - startTime)
+
+  def summary(self):
+    '''
+    Returns the stage's measurements as a dictionary
+    '''
+    seconds = time.time() - self.startTime
+    steps = {}
+    for stepName, latencies in self.latencies.items():
+      p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+      steps[stepName] = {'count': len(latencies), 'mean': float(np.mean(latencies)),
+                          'p50': float(p50), 'p90': float(p90), 'p99': float(p99)}
+    return {'stage': self.name, 'time': self.startTime, 'seconds': seconds, 'items': self.count,
+            'itemsPerSecond': self.count / max(seconds, 1e-9), 'steps': steps}
+
+  def finish(self, failed=False):
+    summary = self.summary()
+    summary['failed'] = failed
+    logger.info('%s: %s %d items in %.2fs, %.1f items/sec', self.name,
+                  'failed after' if failed else 'done,', summary['items'], summary['seconds'],
+                  summary['itemsPerSecond'])
+    for stepName, step in sorted(summary['steps'].items()):
+      logger.info('%s: %s latency p50 %.2fms p90 %.2fms p99 %.2fms', self.name, stepName,
+                    step['p50'] * 1000, step['p90'] * 1000, step['p99'] * 1000)
+    if _settings['metricsPath']:
+      with io.open(_settings['metricsPath'], 'a', encoding='utf-8') as metricsFile:
+        metricsFile.write(json.dumps(summary) + '\n')
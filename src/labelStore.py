@@ -0,0 +1,92 @@
+import numpy as np
+
+class PackedLabels(object):
+  '''
+  Multihot labels of every card stored one bit per category with np.packbits, a row of
+    ceil(numCategories / 8) bytes per card id. Rows are expanded to dense floats only for the
+    card ids asked for, e.g. one batch at a time
+  '''
+  def __init__(self, bits, numCategories):
+    '''
+    Inputs:
+      bits: uint8 array of shape (numCards, ceil(numCategories / 8)) of packed rows
+      numCategories: number of categories
+    '''
+    self.bits = bits
+    self.numCategories = numCategories
+
+  @classmethod
+  def fromPairs(cls, cardIds, categories, numCards, numCategories):
+    '''
+    Builds packed labels from (card id, category) pairs without a dense intermediate
+    Inputs:
+      cardIds: card id of every pair
+      categories: category of every pair
+      numCards: number of cards
+      numCategories: number of categories
+    '''
+    bits = np.zeros((numCards, (numCategories + 7) // 8), dtype=np.uint8)
+    masks = (np.uint8(0x80) >> (categories % 8).astype(np.uint8)).astype(np.uint8)
+    np.bitwise_or.at(bits, (cardIds, categories // 8), masks)
+    return cls(bits, numCategories)
+
+  def __len__(self):
+    return len(self.bits)
+
+  def dense(self, cardIds, dtype=np.float32):
+    '''
+    Expands the labels of some cards to a dense multihot array
+    Inputs:
+      cardIds: array of card ids, -1 for cards without labels gives a row of zeros
+      dtype: type of the returned array (np.float32)
+    Outputs:
+      labels: array of shape (len(cardIds), numCategories)
+    '''
+    cardIds = np.asarray(cardIds)
+    rows = np.unpackbits(self.bits[cardIds], axis=-1, count=self.numCategories)
+    rows[cardIds < 0] = 0
+    return rows.astype(dtype)
+
+  def counts(self, chunkSize=65536):
+    '''
+    Returns the number of cards with every category, unpacking chunkSize cards at a time
+    '''
+    counts = np.zeros(self.numCategories, dtype=np.int64)
+    for start in range(0, len(self.bits), chunkSize):
+      counts += np.unpackbits(self.bits[start:start + chunkSize], axis=1,
+                                count=self.numCategories).sum(axis=0, dtype=np.int64)
+    return counts
+
+  def rows(self, cardIds):
+    '''
+    Returns a LabelRows view of the labels of a sequence of cards
+    '''
+    return LabelRows(self, cardIds)
+
+class LabelRows(object):
+  '''
+  Label targets of a sequence of samples held as card ids. Indexing with an int, slice or index
+    array returns dense float32 rows, so training code can slice it like a dense target array
+  '''
+  def __init__(self, labels, cardIds):
+    '''
+    Inputs:
+      labels: PackedLabels
+      cardIds: card id of every sample, -1 for samples without labels
+    '''
+    self.labels = labels
+    self.cardIds = np.asarray(cardIds, dtype=np.int64)
+
+  def __len__(self):
+    return len(self.cardIds)
+
+  @property
+  def shape(self):
+    return (len(self.cardIds), self.labels.numCategories)
+
+  def __getitem__(self, index):
+    return self.labels.dense(self.cardIds[index])
+
+  def __iter__(self):
+    for cardId in self.cardIds:
+      yield self.labels.dense(cardId)
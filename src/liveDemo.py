@@ -1,21 +1,16 @@
 from __future__ import division, absolute_import
 
-import tflearn
-from tflearn.data_utils import shuffle, to_categorical
-from tflearn.layers.core import input_data, dropout, fully_connected
-from tflearn.layers.conv import conv_2d, max_pool_2d
-from tflearn.layers.recurrent import lstm
-from tflearn.layers.estimator import regression
-from tflearn.data_preprocessing import ImagePreprocessing
-from tflearn.data_augmentation import ImageAugmentation
-import io
-import json
+import numpy as np
 
 from utils import *
 from models import *
+from evaluation import predictInBatches, confusionMatrix, printConfusionMatrix
+from instrumentation import Stage
+from sampling import generateBatch
 
 def demoArtToPrimaryTypeNetwork(artPath, cardPath, jsonPath, modelPath, numDesired=10,
-                                  showPics=False):
+                                  showPics=False, cachePath=None, batchSize=256,
+                                  showConfusion=True, recordsPath=None):
   '''
   Loads and tests a trained convolutional classifier model for a live demo
   Inputs:
@@ -25,36 +20,36 @@ def demoArtToPrimaryTypeNetwork(artPath, cardPath, jsonPath, modelPath, numDesir
     modelPath: path to trained model
     numDesired: size of subset for demo (10)
     showPics: boolean for wether or not card art/scans should be displayed (False)
+    cachePath: directory of a memory-mapped art cache to sample from instead of artPath (None)
+    batchSize: number of cards per predict call (256)
+    showConfusion: boolean for whether to print the per-category confusion matrix (True)
+    recordsPath: directory of packed art records to fetch the demo cards from (None)
   '''
   inputNames, inputs, numCategories, categoryToType, cardNameToCategories = \
-    getLiveDemoPicsToInput(artPath, cardPath, jsonPath, numDesired=numDesired, showPics=showPics)
+    getLiveDemoPicsToInput(artPath, cardPath, jsonPath, numDesired=numDesired, showPics=showPics,
+                            cachePath=cachePath, recordsPath=recordsPath)
 
-  model = artToPrimaryTypeModel(numCategories)
+  model = artToPrimaryTypeModel(numCategories, datasetPath=cachePath, modelPath=modelPath)
   model.load(modelPath, weights_only=True)
 
-  jsonFile = io.open(jsonPath)
-  cardData = json.load(jsonFile)
-
   input('\nPress Enter to continue...')
 
-  numCorrect = 0
-  wrongCards = []
+  with Stage('demoArtToPrimaryTypeNetwork', total=len(inputs)) as stage:
+    predictions = predictInBatches(model, inputs, batchSize=batchSize, stage=stage)
+  predicted = np.argmax(predictions, axis=1)
+  actual = np.array([cardNameToCategories[name] for name in inputNames])
+  correct = predicted == actual
 
-  for i in range(numDesired):
+  for i in range(len(inputNames)):
     print('\nCard Name: ' + inputNames[i])
-    prediction = (model.predict([inputs[i]])).tolist()[0]
-    category = 0
-    for j in range(len(prediction)):
-      if prediction[j] > prediction[category]:
-        category = j
-    print('Prediction: ' + categoryToType[category])
-    print('Actual: ' + categoryToType[cardNameToCategories[inputNames[i]]] + '\n')
-    if categoryToType[category] == categoryToType[cardNameToCategories[inputNames[i]]]:
-      numCorrect+=1
-    else:
-      wrongCards.append((inputNames[i], categoryToType[category],
-        categoryToType[cardNameToCategories[inputNames[i]]]))
-  print('\n\nPercentage Correct: %2.2f%%' % (numCorrect * 100 / numDesired))
+    print('Prediction: ' + categoryToType[predicted[i]])
+    print('Actual: ' + categoryToType[actual[i]] + '\n')
+  wrongCards = [(inputNames[i], categoryToType[predicted[i]], categoryToType[actual[i]])
+                  for i in np.nonzero(~correct)[0]]
+  print('\n\nPercentage Correct: %2.2f%%' % (correct.mean() * 100))
+  if showConfusion:
+    print('\nCONFUSION MATRIX (rows actual, columns predicted):')
+    printConfusionMatrix(confusionMatrix(actual, predicted, numCategories), categoryToType)
   print('\nWRONG CARDS:')
   for wrongCard in wrongCards:
     print('Card Name: ' + wrongCard[0])
@@ -68,19 +63,23 @@ def demoNameTypeSubtypeGenerator(jsonPath, modelPath, maxLength):
     jsonPath: path to card data json file
     maxLength: the maximum length of a single generated sample
   '''
-  (_, _, charIndex), totalString = simpleGenerateTypeSubtypeToNameInputs(jsonPath, maxLength)
+  sequences, totalString = simpleGenerateTypeSubtypeToNameSequences(jsonPath, maxLength)
+  charIndex = sequences.charIdx
 
   model = typeSubtypeNameGeneratorModel(maxLength, charIndex)
   model.load(modelPath)
 
   input('\nPress Enter to continue...')
 
-  for i in range(1,5):
+  temperatures = [i * 0.25 for i in range(1,5)]
+  seeds = []
+  for temperature in temperatures:
     randomIndex = random.randint(0, len(totalString) -  maxLength - 1)
-    seed = totalString[randomIndex:randomIndex + maxLength]
-    temperature = i * 0.25
+    seeds.append(totalString[randomIndex:randomIndex + maxLength])
+  # All temperatures are sampled together, one forward pass per generated char
+  generatedBatch = generateBatch(model, charIndex, maxLength, seeds, temperatures, 120)
+  for temperature, generated in zip(temperatures, generatedBatch):
     print('\nGenerated test with temperature of %1.2f' % temperature)
-    generated = model.generate(120, temperature=temperature, seq_seed=seed)
     generated = generated.split('\n')
     generated = generated[:-1]
     generated.pop(0)
@@ -1,37 +1,53 @@
 from __future__ import division, absolute_import
 
-import tflearn
-from tflearn.layers.core import input_data, dropout, fully_connected
-from tflearn.layers.conv import conv_2d, max_pool_2d
-from tflearn.layers.recurrent import lstm
-from tflearn.layers.estimator import regression
-from tflearn.data_preprocessing import ImagePreprocessing
-from tflearn.data_augmentation import ImageAugmentation
-
 from utils import *
+from datasetStats import loadDatasetStats, loadModelStats
+
+# Shape of one art sample fed to artToPrimaryTypeModel
+ART_INPUT_SHAPE = (64, 64, 3)
+CHECKPOINT_PATH = './classifier_checkpoints/'
+BEST_CHECKPOINT_PATH = './best_classifier_checkpoints'
 
-def artToPrimaryTypeModel(numCategories, checkpoint_path='./classifier_checkpoints/',
-                            best_checkpoint_path='./best_classifier_checkpoints/'):
+def artToPrimaryTypeModel(numCategories, checkpoint_path=CHECKPOINT_PATH,
+                            best_checkpoint_path=BEST_CHECKPOINT_PATH, datasetPath=None,
+                            modelPath=None):
   '''
   Convolutional network model for categorizing card art into primary types
   Inputs:
     numCategories: total number of valid categories
     checkpoint_path: path to save model after every epoch ('./classifier_checkpoints/')
     best_checkpoint_path: path to save the best models by
-      validation ('./best_classifier_checkpoints/')
+      validation ('./best_classifier_checkpoints')
+    datasetPath: directory of an art cache whose stored statistics are used for normalization,
+      the original art set's statistics are used if None or not computed (None)
+    modelPath: path to a trained model that will be loaded, if given the statistics stored with
+      its checkpoint are used instead of datasetPath's (None)
   Outputs:
-    model: convolutional model, ready to be trained
+    model: convolutional model, ready to be trained or loaded
   '''
+  # tflearn is imported here rather than at module level so that the data preparation code can
+  # be used without loading TensorFlow
+  import tflearn
+  from tflearn.layers.core import input_data, dropout, fully_connected
+  from tflearn.layers.conv import conv_2d, max_pool_2d
+  from tflearn.layers.estimator import regression
+  from tflearn.data_preprocessing import ImagePreprocessing
+  from tflearn.data_augmentation import ImageAugmentation
+
   # Data Preprocessing and Augmentation
+  if modelPath:
+    mean, std = loadModelStats(modelPath, datasetPath)
+  else:
+    mean, std = loadDatasetStats(datasetPath)
   preprocessor = ImagePreprocessing()
-  preprocessor.add_featurewise_zero_center(mean=102.59733902)
-  preprocessor.add_featurewise_stdnorm(std=65.9076363382)
+  preprocessor.add_featurewise_zero_center(mean=mean)
+  preprocessor.add_featurewise_stdnorm(std=std)
 
   augmentor = ImageAugmentation()
   augmentor.add_random_flip_leftright()
 
   # Model Structure
-  network = input_data(shape=[None, 64, 64, 3],
+  network = input_data(shape=[None] + list(ART_INPUT_SHAPE),
     data_preprocessing=preprocessor,
     data_augmentation=augmentor)
   network = conv_2d(network, 64, 4, activation='relu')
@@ -46,8 +62,8 @@ def artToPrimaryTypeModel(numCategories, checkpoint_path='./classifier_checkpoin
   network = regression(network, optimizer='adam', loss='categorical_crossentropy',
                         learning_rate=0.001)
 
-  model = tflearn.DNN(network, tensorboard_verbose=0, checkpoint_path='./classifier_checkpoints/',
-                        best_checkpoint_path='./best_classifier_checkpoints')
+  model = tflearn.DNN(network, tensorboard_verbose=0, checkpoint_path=checkpoint_path,
+                        best_checkpoint_path=best_checkpoint_path)
   return model
 
 def typeSubtypeNameGeneratorModel(maxLength, charIndex, checkpoint_path='./generator_checkpoints/'):
@@ -58,6 +74,11 @@ def typeSubtypeNameGeneratorModel(maxLength, charIndex, checkpoint_path='./gener
     charIndex: map from chars to the index they represent in a onehot encoding
     checkpoint_path: path to save model after every epoch ('./generator_checkpoints/')
   '''
+  import tflearn
+  from tflearn.layers.core import input_data, dropout, fully_connected
+  from tflearn.layers.recurrent import lstm
+  from tflearn.layers.estimator import regression
+
   network = input_data(shape=[None, maxLength, len(charIndex)])
   network = lstm(network, 512, return_seq=True)
   network = dropout(network, 0.5)
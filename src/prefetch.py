@@ -0,0 +1,158 @@
+from os import listdir
+from PIL import Image
+from queue import Queue, Empty, Full
+import threading
+import numpy as np
+
+_END = object()
+
+class PrefetchLoader(object):
+  '''
+  Decodes card art into fixed-size chunks on background threads, holding at most maxChunks
+    decoded chunks in a bounded queue. Iterating yields (X, Y) chunks while the next ones are
+    being decoded, so I/O overlaps with training and peak memory is about
+    (maxChunks + numWorkers + 1) chunks regardless of the size of the art set
+  '''
+  def __init__(self, artPath, files, labels, numCategories, chunkSize=2048, maxChunks=2,
+                numWorkers=2, augmentor=None, shuffle=True, seed=None):
+    '''
+    Inputs:
+      artPath: path to card art
+      files: list of art file names
+      labels: category of every file
+      numCategories: total number of valid categories
+      chunkSize: number of images per chunk (2048)
+      maxChunks: number of decoded chunks the queue holds (2)
+      numWorkers: number of decode threads (2)
+      augmentor: function of a float32 image chunk and a RandomState applied to every chunk, e.g.
+        a BatchAugmentor (None)
+      shuffle: boolean for whether to visit files in a new random order every pass (True)
+      seed: seed for the shuffle order and the augmentation of every chunk (None)
+    '''
+    self.artPath = artPath
+    self.files = list(files)
+    self.labels = np.asarray(labels)
+    self.numCategories = numCategories
+    self.chunkSize = chunkSize
+    self.maxChunks = maxChunks
+    self.numWorkers = numWorkers
+    self.augmentor = augmentor
+    self.shuffle = shuffle
+    self.random = np.random.RandomState(seed)
+
+  def __len__(self):
+    return (len(self.files) + self.chunkSize - 1) // self.chunkSize
+
+  def decodeChunk(self, indices, chunkSeed=None):
+    '''
+    Decodes the files at indices into a float32 image array and onehot targets
+    Inputs:
+      indices: array of file numbers
+      chunkSeed: seed of the RandomState the chunk is augmented with (None)
+    '''
+    X = np.stack([np.asarray(Image.open(self.artPath + self.files[index]), dtype=np.float32)
+                    for index in indices])
+    if self.augmentor is not None:
+      X = self.augmentor(X, np.random.RandomState(chunkSeed))
+    Y = np.zeros((len(indices), self.numCategories), dtype=np.float32)
+    Y[np.arange(len(indices)), self.labels[indices]] = 1
+    return X, Y
+
+  def __iter__(self):
+    indices = np.arange(len(self.files))
+    if self.shuffle:
+      self.random.shuffle(indices)
+    chunks = [indices[start:start + self.chunkSize]
+                for start in range(0, len(indices), self.chunkSize)]
+    # Drawn here in chunk order, so every chunk's augmentation is fixed by seed whichever worker
+    # decodes it
+    chunkSeeds = self.random.randint(2 ** 31, size=len(chunks))
+    tasks = Queue()
+    for chunkIndex, chunk in enumerate(chunks):
+      tasks.put((chunkIndex, chunk, chunkSeeds[chunkIndex]))
+    results = Queue(maxsize=self.maxChunks)
+    stop = threading.Event()
+
+    def put(item):
+      # Bounded put, retried so a stopped consumer never leaves a worker blocked
+      while not stop.is_set():
+        try:
+          results.put(item, timeout=0.1)
+          return
+        except Full:
+          continue
+
+    def worker():
+      while not stop.is_set():
+        try:
+          chunkIndex, chunk, chunkSeed = tasks.get_nowait()
+        except Empty:
+          break
+        try:
+          put((chunkIndex, self.decodeChunk(chunk, chunkSeed)))
+        except Exception as error:
+          put((chunkIndex, error))
+      put((None, _END))
+
+    threads = [threading.Thread(target=worker) for _ in range(self.numWorkers)]
+    for thread in threads:
+      thread.daemon = True
+      thread.start()
+
+    finished = 0
+    try:
+      while finished < len(threads):
+        _, result = results.get()
+        if result is _END:
+          finished += 1
+        elif isinstance(result, Exception):
+          raise result
+        else:
+          yield result
+    finally:
+      stop.set()
+      while not results.empty():
+        results.get_nowait()
+
+def prefetchLoaderFromDirectory(artPath, jsonPath, cutoffSize=500, testProp=0.2, duplicates=None,
+                                **loaderArgs):
+  '''
+  Lists and labels the card art in a directory without decoding it, returning prefetching loaders
+    for the training and test/validation sets
+  Inputs:
+    artPath: path to card art
+    jsonPath: path to card data json file
+    cutoffSize: minimum representation for a primary type to be valid (500)
+    testProp: proportion of art to separate from training for test/validation (0.2)
+    duplicates: handling of near-duplicate art, None, 'keepOne' or 'splitByCluster', see
+      artDedup.selectDuplicates (None)
+    loaderArgs: extra PrefetchLoader arguments, the test loader never augments
+  Outputs:
+    trainLoader: PrefetchLoader over the training art
+    testLoader: PrefetchLoader over the test/validation art
+    numCategories: total number of valid categories
+  '''
+  from utils import generateCardToSimpleTypeDict
+  from scanManifest import parseCardFileName
+  from artDedup import artClusters, selectDuplicates
+
+  cardNameToCategories, numCategories, typeToCategory = generateCardToSimpleTypeDict(jsonPath,
+                                                                                      cutoffSize)
+  trainFiles, trainLabels, testFiles, testLabels = [], [], [], []
+  artFiles = [art for art in listdir(artPath) if not art.startswith('.')]
+  fileToCluster = artClusters(artPath) if duplicates else None
+  artFiles, isTest = selectDuplicates(artFiles, fileToCluster, duplicates, testProp,
+                                      np.random.random)
+  for art, testArt in zip(artFiles, isTest):
+    category = cardNameToCategories.get(parseCardFileName(art), typeToCategory['Other'])
+    if testArt:
+      testFiles.append(art)
+      testLabels.append(category)
+    else:
+      trainFiles.append(art)
+      trainLabels.append(category)
+
+  testArgs = dict(loaderArgs, augmentor=None, shuffle=False)
+  return (PrefetchLoader(artPath, trainFiles, trainLabels, numCategories, **loaderArgs),
+            PrefetchLoader(artPath, testFiles, testLabels, numCategories, **testArgs),
+            numCategories)
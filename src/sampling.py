@@ -0,0 +1,174 @@
+import argparse
+import io
+import json
+import numpy as np
+
+def sampleRows(probabilities, temperatures, random):
+  '''
+  Draws one index from every row of a probability matrix after applying a per-row temperature,
+    the vectorized form of tflearn's per-sequence sampling
+  Inputs:
+    probabilities: array of shape (numRows, vocabSize) of softmax outputs
+    temperatures: array of numRows temperatures
+    random: numpy RandomState to draw from
+  Outputs:
+    indices: int array of numRows sampled indices
+  '''
+  logits = np.log(np.maximum(probabilities, 1e-12)) / temperatures[:, None]
+  logits -= logits.max(axis=1, keepdims=True)
+  weights = np.exp(logits)
+  cumulative = np.cumsum(weights, axis=1)
+  draws = random.random_sample(len(weights)) * cumulative[:, -1]
+  indices = (cumulative < draws[:, None]).sum(axis=1)
+  return np.minimum(indices, weights.shape[1] - 1)
+
+def randomSeeds(totalString, count, seqMaxlen, random):
+  '''
+  Picks random seed windows from the training string
+  Inputs:
+    totalString: complete training string
+    count: number of seeds
+    seqMaxlen: seed length, the model's sequence length
+    random: numpy RandomState to draw from
+  Outputs:
+    seeds: list of count seed strings
+  '''
+  starts = random.randint(0, len(totalString) - seqMaxlen, size=count)
+  return [totalString[start:start + seqMaxlen] for start in starts]
+
+def generateBatch(model, charIdx, seqMaxlen, seeds, temperatures, length, batchSize=512,
+                    seed=None):
+  '''
+  Generates many sequences at once with a trained typeSubtypeNameGeneratorModel. Every forward
+    pass advances all sequences of a batch by one char, instead of one pass per char of one
+    sequence as model.generate does
+  Inputs:
+    model: trained tflearn SequenceGenerator
+    charIdx: map from chars to their index in the onehot encoding
+    seqMaxlen: the model's sequence length
+    seeds: list of seed strings, each seqMaxlen long
+    temperatures: one temperature per seed, or a single temperature for all
+    length: number of chars to generate per sequence
+    batchSize: number of sequences per forward pass (512)
+    seed: seed for the sampling random state (None)
+  Outputs:
+    generated: list of generated strings, each its seed followed by length new chars
+  '''
+  random = np.random.RandomState(seed)
+  idxChar = dict((index, char) for char, index in charIdx.items())
+  idxChars = np.array([idxChar[index] for index in range(len(charIdx))])
+  temperatures = np.broadcast_to(np.asarray(temperatures, dtype=np.float64), (len(seeds),))
+  # tflearn's generate feeds the full batch through its predictor, predict only takes inputs
+  predict = model._predict if hasattr(model, '_predict') else model.predict
+  identity = np.eye(len(charIdx), dtype=np.float32)
+
+  generated = []
+  for start in range(0, len(seeds), batchSize):
+    batchSeeds = seeds[start:start + batchSize]
+    windows = np.array([[charIdx[char] for char in batchSeed[-seqMaxlen:]]
+                          for batchSeed in batchSeeds])
+    newChars = np.empty((len(batchSeeds), length), dtype=np.int64)
+    for step in range(length):
+      probabilities = np.asarray(predict(identity[windows]), dtype=np.float64)
+      newChars[:, step] = sampleRows(probabilities, temperatures[start:start + len(batchSeeds)],
+                                      random)
+      windows = np.concatenate([windows[:, 1:], newChars[:, step:step + 1]], axis=1)
+    for batchSeed, chars in zip(batchSeeds, idxChars[newChars]):
+      generated.append(batchSeed + ''.join(chars))
+  return generated
+
+def candidateNames(generated, seqMaxlen):
+  '''
+  Extracts the complete 'type1,type2;subtype1,subtype2;name' lines generated after the seed
+  Inputs:
+    generated: list of strings from generateBatch
+    seqMaxlen: seed length
+  Outputs:
+    candidates: list of (types, subtypes, name) tuples, types and subtypes may be empty strings
+  '''
+  candidates = []
+  for text in generated:
+    # The first line may continue the seed and the last may be cut off
+    lines = [line for line in text[seqMaxlen:].split('\n')[1:-1] if line]
+    for line in lines:
+      parts = line.split(';')
+      candidates.append((parts[0] if len(parts) > 1 else '', parts[1] if len(parts) > 2 else '',
+                          parts[-1]))
+  return candidates
+
+def generateNames(model, charIdx, seqMaxlen, totalString, numSequences, temperatures,
+                    length=200, batchSize=512, seed=None):
+  '''
+  Generates candidate names over a range of temperatures in batched passes
+  Inputs:
+    model: trained tflearn SequenceGenerator
+    charIdx: map from chars to their index in the onehot encoding
+    seqMaxlen: the model's sequence length
+    totalString: complete training string to draw seeds from
+    numSequences: number of sequences per temperature
+    temperatures: list of temperatures
+    length: number of chars to generate per sequence (200)
+    batchSize: number of sequences per forward pass (512)
+    seed: seed for seeds and sampling (None)
+  Outputs:
+    namesByTemperature: dictionary from temperature to a list of (types, subtypes, name) tuples
+  '''
+  random = np.random.RandomState(seed)
+  seeds = randomSeeds(totalString, numSequences * len(temperatures), seqMaxlen, random)
+  sequenceTemperatures = np.repeat(temperatures, numSequences)
+  generated = generateBatch(model, charIdx, seqMaxlen, seeds, sequenceTemperatures, length,
+                              batchSize=batchSize, seed=random.randint(2 ** 31))
+  return dict((temperature, candidateNames(generated[index * numSequences:
+                                                      (index + 1) * numSequences], seqMaxlen))
+                for index, temperature in enumerate(temperatures))
+
+def writeSamples(samples, temperatures, epoch, logPath=None):
+  '''
+  Prints generated samples, or appends them to a log file
+  Inputs:
+    samples: list of generated strings
+    temperatures: temperature of each sample
+    epoch: number of the epoch the samples come from
+    logPath: file to append to, if None samples are printed (None)
+  '''
+  text = '-- TESTING epoch %d...\n' % epoch
+  for sample, temperature in zip(samples, temperatures):
+    text += '-- Test with temperature of %1.1f --\n%s\n' % (temperature, sample)
+  if logPath:
+    with io.open(logPath, 'a', encoding='utf-8') as logFile:
+      logFile.write(text)
+  else:
+    print(text)
+
+def sampleFromCheckpoint(modelPath, maxLength, charIdx, seed, temperatures, length, epoch,
+                          logPath):
+  '''
+  Rebuilds the generator from a saved checkpoint and logs samples from it, meant to run in a
+    separate process so training continues meanwhile
+  Inputs:
+    modelPath: path to the saved generator model
+    maxLength: the model's sequence length
+    charIdx: map from chars to their index in the onehot encoding
+    seed: seed string
+    temperatures: list of temperatures to sample at
+    length: number of chars to generate per sample
+    epoch: number of the epoch the checkpoint was saved after
+    logPath: file to append the samples to
+  '''
+  from models import typeSubtypeNameGeneratorModel
+
+  model = typeSubtypeNameGeneratorModel(maxLength, charIdx)
+  model.load(modelPath)
+  samples = generateBatch(model, charIdx, maxLength, [seed] * len(temperatures), temperatures,
+                            length)
+  writeSamples(samples, temperatures, epoch, logPath)
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser(description='Log samples from a saved generator model')
+  parser.add_argument('argsPath', help='json file of sampleFromCheckpoint arguments')
+  args = parser.parse_args()
+  with io.open(args.argsPath, encoding='utf-8') as argsFile:
+    sampleArgs = json.load(argsFile)
+  sampleFromCheckpoint(sampleArgs['modelPath'], sampleArgs['maxLength'], sampleArgs['charIdx'],
+                        sampleArgs['seed'], sampleArgs['temperatures'], sampleArgs['length'],
+                        sampleArgs['epoch'], sampleArgs['logPath'])
@@ -0,0 +1,132 @@
+from os import listdir, remove, replace
+from os.path import exists, getmtime, getsize
+import io
+import json
+
+from cardTable import loadCardTable
+from instrumentation import logger
+
+MANIFEST_FILE = '.scanManifest.json'
+
+def representsInt(s):
+  '''
+  Returns True if the passed in string represents an int, False otherwise
+  Inputs:
+    s: string to check
+  Outputs:
+    True or False depending on int representation
+  '''
+  try:
+      int(s)
+      return True
+  except ValueError:
+      return False
+
+def parseCardFileName(fileName):
+  '''
+  Gets the card name from a card scan or art file name of the form '[number.]name[ ].ext'
+  Inputs:
+    fileName: name of the scan or art file
+  Outputs:
+    cardName: name of the card
+  '''
+  fileParts = fileName.split('.')
+  if(representsInt(fileParts[0])):
+    fileParts.pop(0)
+  if fileParts[0][-1] == ' ':
+    fileParts[0] = fileParts[0][:-1]
+  return fileParts[0]
+
+def _tokenAndSplitNames(table):
+  '''
+  Collects the names that token and split card scans are saved under
+  '''
+  tokenNames = set()
+  splitNames = set()
+  for cardId, cardName in enumerate(table.names()):
+    layout = table.layout(cardId)
+    if layout == 'token':
+      if cardName.split(" ")[-1] == 'card':
+        tokenNames.add(cardName.split(" ")[0])
+      else:
+        tokenNames.add(cardName)
+    elif layout == 'split':
+      splitNames.add(table.linkedNames(cardId))
+  return tokenNames, splitNames
+
+def buildScanManifest(scanPath, jsonPath):
+  '''
+  Parses every file name in a scan or art directory once and resolves it to its card record.
+    The manifest is stored in the directory and only new files are parsed on later calls, unless
+    the json file has changed
+  Inputs:
+    scanPath: path to card scans or card art
+    jsonPath: path to card data json file
+  Outputs:
+    manifest: dictionary from file name to a dictionary with the card 'name', its 'cardId' in the
+      card table (-1 if unknown), 'layout', primary 'type' (None if unknown or without types), and
+      whether the file is a 'token' or 'split' scan
+  '''
+  manifestPath = scanPath + MANIFEST_FILE
+  stamp = [getsize(jsonPath), getmtime(jsonPath)]
+  manifest = {}
+  if exists(manifestPath):
+    with io.open(manifestPath, encoding='utf-8') as manifestFile:
+      stored = json.load(manifestFile)
+    if stored['stamp'] == stamp:
+      manifest = stored['files']
+
+  files = [fileName for fileName in listdir(scanPath)
+            if not fileName.startswith('.')]
+  newFiles = [fileName for fileName in files if fileName not in manifest]
+  if not newFiles and len(manifest) == len(files):
+    return manifest
+
+  table = loadCardTable(jsonPath)
+  nameToId = table.nameToId()
+  tokenNames, splitNames = _tokenAndSplitNames(table)
+  for fileName in newFiles:
+    cardName = parseCardFileName(fileName)
+    cardId = nameToId.get(cardName, -1)
+    types = table.types(cardId) if cardId >= 0 else []
+    fileParts = fileName.split('.')
+    manifest[fileName] = {
+      'name': cardName,
+      'cardId': cardId,
+      'layout': table.layout(cardId) if cardId >= 0 else None,
+      'type': types[0] if types else None,
+      'token': any(part in tokenNames for part in fileParts),
+      'split': any(part in splitNames for part in fileParts),
+    }
+  currentFiles = set(files)
+  manifest = dict((fileName, entry) for fileName, entry in manifest.items()
+                    if fileName in currentFiles)
+
+  with io.open(manifestPath + '.tmp', 'w', encoding='utf-8') as manifestFile:
+    json.dump({'stamp': stamp, 'files': manifest}, manifestFile)
+  replace(manifestPath + '.tmp', manifestPath)
+  return manifest
+
+def removeScans(scanPath, jsonPath, flag, dryRun=False):
+  '''
+  Removes the scans whose manifest entry has flag set
+  Inputs:
+    scanPath: path to card scans
+    jsonPath: path to card data json file
+    flag: manifest flag to remove by, 'token' or 'split'
+    dryRun: boolean for whether to only list the files that would be removed (False)
+  Outputs:
+    removed: sorted list of the matching file names
+  '''
+  manifest = buildScanManifest(scanPath, jsonPath)
+  removed = sorted(fileName for fileName, entry in manifest.items() if entry[flag])
+  for fileName in removed:
+    if dryRun:
+      logger.info('Would remove: %s', fileName)
+    else:
+      remove(scanPath + fileName)
+  if not dryRun:
+    # Drop the removed files now rather than on the next listing
+    buildScanManifest(scanPath, jsonPath)
+  logger.info('%s %d %s scans', 'Found' if dryRun else 'Removed', len(removed), flag)
+  return removed
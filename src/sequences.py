@@ -0,0 +1,199 @@
+import numpy as np
+
+def charsToDictionary(string):
+  '''
+  Creates the char to index map used by tflearn's string_to_semi_redundant_sequences
+  Inputs:
+    string: complete training string
+  Outputs:
+    charIdx: map from each char in string to its index, in sorted char order
+  '''
+  return dict((char, index) for index, char in enumerate(sorted(set(string))))
+
+def encodeString(string, charIdx):
+  '''
+  Encodes a string into an integer array using a char to index map
+  Inputs:
+    string: string to encode, every char must be in charIdx
+    charIdx: map from chars to indices
+  Outputs:
+    codes: array of char indices, one per char of string
+  '''
+  codePoints = np.frombuffer(string.encode('utf-32-le'), dtype=np.uint32)
+  chars = sorted(charIdx, key=ord)
+  keys = np.array([ord(char) for char in chars], dtype=np.uint32)
+  values = np.array([charIdx[char] for char in chars], dtype=np.int64)
+  positions = np.searchsorted(keys, codePoints)
+  if len(codePoints) and (positions.max() >= len(keys) or
+                            not np.array_equal(keys[positions], codePoints)):
+    raise ValueError('String contains chars missing from the char index')
+  # Chosen from the largest index rather than the number of chars, since indices may be shifted
+  # to keep 0 free for padding
+  dtype = np.uint8 if values.max(initial=0) < 256 else np.uint16
+  return values[positions].astype(dtype)
+
+class SemiRedundantSequences(object):
+  '''
+  Lazy equivalent of tflearn's string_to_semi_redundant_sequences. The string is kept as one
+    compact integer array and onehot (X, Y) batches are only built when asked for, so memory is
+    bounded by the batch size instead of the number of sequences
+  Attributes:
+    charIdx: map from chars to their index in the onehot encoding
+    codes: encoded string
+    starts: start offset of every sequence in codes
+  '''
+  def __init__(self, string, seqMaxlen=25, redunStep=3, charIdx=None):
+    '''
+    Inputs:
+      string: complete training string
+      seqMaxlen: length of every input sequence (25)
+      redunStep: offset between the starts of consecutive sequences (3)
+      charIdx: map from chars to indices, if None built from string (None)
+    '''
+    if charIdx is None:
+      charIdx = charsToDictionary(string)
+    self.charIdx = charIdx
+    self.seqMaxlen = seqMaxlen
+    self.codes = encodeString(string, charIdx)
+    self.starts = np.arange(0, max(len(string) - seqMaxlen, 0), redunStep)
+
+  def __len__(self):
+    return len(self.starts)
+
+  def indexBatch(self, indices):
+    '''
+    Returns the sequences at indices as char indices
+    Inputs:
+      indices: array of sequence numbers
+    Outputs:
+      X: int array of shape (len(indices), seqMaxlen)
+      Y: int array of the char following each sequence
+    '''
+    starts = self.starts[indices]
+    X = self.codes[starts[:, None] + np.arange(self.seqMaxlen)]
+    Y = self.codes[starts + self.seqMaxlen]
+    return X, Y
+
+  def batch(self, indices):
+    '''
+    Returns the sequences at indices in the same onehot format as string_to_semi_redundant_sequences
+    Inputs:
+      indices: array of sequence numbers
+    Outputs:
+      X: bool array of shape (len(indices), seqMaxlen, len(charIdx))
+      Y: bool array of shape (len(indices), len(charIdx))
+    '''
+    X, Y = self.indexBatch(indices)
+    identity = np.eye(len(self.charIdx), dtype=bool)
+    return identity[X], identity[Y]
+
+  def iterBatches(self, batchSize, shuffle=True, seed=None, indices=None):
+    '''
+    Yields onehot (X, Y) batches covering every sequence once
+    Inputs:
+      batchSize: number of sequences per batch
+      shuffle: boolean for whether to visit sequences in random order (True)
+      seed: seed for the shuffle order (None)
+      indices: sequence numbers to cover, if None every sequence is covered (None)
+    Outputs:
+      generator of (X, Y) tuples
+    '''
+    indices = np.arange(len(self)) if indices is None else np.array(indices)
+    if shuffle:
+      np.random.RandomState(seed).shuffle(indices)
+    for start in range(0, len(indices), batchSize):
+      yield self.batch(indices[start:start + batchSize])
+
+def encodeSequences(strings, charIdx):
+  '''
+  Encodes many strings into one compact integer buffer with offsets, in a single vectorized pass
+  Inputs:
+    strings: list of strings, every char must be in charIdx
+    charIdx: map from chars to indices
+  Outputs:
+    sequences: PackedSequences of the encoded strings
+  '''
+  lengths = np.array([len(string) for string in strings], dtype=np.int64)
+  offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+  np.cumsum(lengths, out=offsets[1:])
+  return PackedSequences(encodeString(''.join(strings), charIdx), offsets)
+
+def lengthBucketedBatches(lengths, batchSize, shuffle=True, seed=None):
+  '''
+  Groups sequences of similar length into batches, so padding a batch to its longest sequence
+    adds little. Sequences are sorted by length, ties broken randomly, cut into batches, and the
+    batches visited in random order
+  Inputs:
+    lengths: array of sequence lengths
+    batchSize: number of sequences per batch
+    shuffle: boolean for whether to randomize ties and the batch order (True)
+    seed: seed for the random order (None)
+  Outputs:
+    batches: list of index arrays, one per batch
+  '''
+  random = np.random.RandomState(seed)
+  tiebreak = random.random_sample(len(lengths)) if shuffle else np.arange(len(lengths))
+  order = np.lexsort((tiebreak, lengths))
+  batches = [order[start:start + batchSize] for start in range(0, len(order), batchSize)]
+  if shuffle:
+    random.shuffle(batches)
+  return batches
+
+class PackedSequences(object):
+  '''
+  Variable length integer sequences stored end to end in one array, sequence i is
+    codes[offsets[i]:offsets[i + 1]]. Padded arrays are only built per batch
+  Attributes:
+    codes: every sequence's codes, concatenated
+    offsets: start of every sequence in codes, followed by the total length
+    lengths: length of every sequence
+  '''
+  def __init__(self, codes, offsets):
+    self.codes = codes
+    self.offsets = offsets
+    self.lengths = np.diff(offsets)
+
+  def __len__(self):
+    return len(self.lengths)
+
+  def __getitem__(self, index):
+    return self.codes[self.offsets[index]:self.offsets[index + 1]]
+
+  def padded(self, indices, length=None, padValue=0):
+    '''
+    Returns the sequences at indices padded at the end, or truncated, to a common length
+    Inputs:
+      indices: array of sequence numbers
+      length: padded length, if None will be set to the longest of the sequences (None)
+      padValue: value to pad with (0)
+    Outputs:
+      batch: int array of shape (len(indices), length)
+      lengths: unpadded length of every sequence, at most length
+    '''
+    lengths = self.lengths[indices]
+    if length is None:
+      length = int(lengths.max()) if len(lengths) else 0
+    lengths = np.minimum(lengths, length)
+    positions = np.arange(length)
+    mask = positions < lengths[:, None]
+    batch = np.full((len(lengths), length), padValue, dtype=self.codes.dtype)
+    batch[mask] = self.codes[(self.offsets[indices][:, None] + positions)[mask]]
+    return batch, lengths
+
+  def iterBatches(self, batchSize, shuffle=True, seed=None, maxLength=None):
+    '''
+    Yields length-bucketed batches, each padded only to its own longest sequence
+    Inputs:
+      batchSize: number of sequences per batch
+      shuffle: boolean for whether to visit batches in random order (True)
+      seed: seed for the batch order (None)
+      maxLength: length to truncate sequences to, if None nothing is truncated (None)
+    Outputs:
+      generator of (indices, batch, lengths) tuples, see padded
+    '''
+    for indices in lengthBucketedBatches(self.lengths, batchSize, shuffle, seed):
+      length = None
+      if maxLength is not None:
+        length = min(int(self.lengths[indices].max()), maxLength)
+      batch, lengths = self.padded(indices, length)
+      yield indices, batch, lengths
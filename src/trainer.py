@@ -1,12 +1,24 @@
 from __future__ import division, absolute_import
 
-import tflearn
-from tflearn.data_utils import shuffle, to_categorical
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+import numpy as np
 
 from utils import *
 from models import *
+from artCache import artCacheExists, buildArtCache, iterArtBatches, loadArtCache
+from datasetStats import computeDatasetStats, datasetStatsExist, saveModelStats
+from instrumentation import Stage, logger
+from prefetch import prefetchLoaderFromDirectory
+from sampling import generateBatch, writeSamples
+import sampling
 
-def trainArtToPrimaryTypeModel(artPath, jsonPath, testProp, numEpochs=50):
+def trainArtToPrimaryTypeModel(artPath, jsonPath, testProp, numEpochs=50, cachePath=None,
+                                recordsPath=None, augmentor=None, chunkSize=2048):
   '''
   Trains a convolutional network to categorize card art by primary type
   Inputs:
@@ -14,20 +26,128 @@ def trainArtToPrimaryTypeModel(artPath, jsonPath, testProp, numEpochs=50):
     jsonPath: path to card data json file
     testProp: proportion of samples to be used for test/validation
     numEpochs: number of epochs to train for (50)
+    cachePath: directory of a memory-mapped art cache, built from artPath along with its
+      normalization statistics on first use if missing, if None art is decoded into memory (None)
+    recordsPath: directory of packed art records to read instead of artPath when cachePath is
+      None (None)
+    augmentor: function applied to every chunk of cached training art as it is read, e.g. a
+      BatchAugmentor replacing the flipped and blurred copies on disk, needs cachePath (None)
+    chunkSize: number of cached images read and augmented at a time when augmentor is set (2048)
   '''
-  (X, Y), (X_Test, Y_Test), numCategories = turnPicsToSimpleInputs(artPath,
-                                                                    jsonPath,
-                                                                    testProp=testProp)
-  X, Y = shuffle(X, Y)
-  Y = to_categorical(Y, numCategories)
+  from tflearn.data_utils import shuffle, to_categorical
+
+  if augmentor is not None and not cachePath:
+    raise ValueError('augmentor needs cachePath, use trainArtToPrimaryTypeModelPrefetched to '
+                      'augment art decoded from artPath')
+  if cachePath:
+    if not artCacheExists(cachePath):
+      buildArtCache(artPath, jsonPath, cachePath)
+    if not datasetStatsExist(cachePath):
+      computeDatasetStats(cachePath)
+    # The cache is stored shuffled, so the memory-mapped views are used as they are
+    (X, Y), (X_Test, Y_Test), numCategories = loadArtCache(cachePath, testProp=testProp)
+  else:
+    (X, Y), (X_Test, Y_Test), numCategories = turnPicsToSimpleInputs(artPath,
+                                                                      jsonPath,
+                                                                      testProp=testProp,
+                                                                      recordsPath=recordsPath)
+    X, Y = shuffle(X, Y)
   Y_Test = to_categorical(Y_Test, numCategories)
 
   # Train model as classifier
-  model = artToMainTypeModel(numCategories)
-  model.fit(X, Y, n_epoch=numEpochs, shuffle=True, validation_set=(X_Test, Y_Test),
-              show_metric=True, batch_size=100, run_id='mtg_classifier')
+  model = artToPrimaryTypeModel(numCategories, datasetPath=cachePath)
+  trainingStart = time.time()
+  try:
+    if cachePath and augmentor is not None:
+      # Chunks are read from the memory-mapped cache and augmented one at a time, then validated
+      # once per epoch
+      with Stage('trainArtToPrimaryTypeModel', total=len(X) * numEpochs) as stage:
+        for epoch in range(numEpochs):
+          for chunkX, chunkY in iterArtBatches(X, Y, numCategories, batchSize=chunkSize,
+                                                 augmentor=augmentor):
+            with stage.step('fitChunk'):
+              model.fit(chunkX, chunkY, n_epoch=1, shuffle=True, show_metric=True,
+                          batch_size=100, run_id='mtg_classifier')
+            stage.tick(len(chunkX))
+          with stage.step('validate'):
+            accuracy = model.evaluate(X_Test, Y_Test, batch_size=100)
+          logger.info('Epoch %d validation accuracy: %s', epoch + 1, accuracy)
+      return
+
+    Y = to_categorical(Y, numCategories)
+    with Stage('trainArtToPrimaryTypeModel', total=len(X) * numEpochs) as stage:
+      model.fit(X, Y, n_epoch=numEpochs, shuffle=True, validation_set=(X_Test, Y_Test),
+                  show_metric=True, batch_size=100, run_id='mtg_classifier')
+      stage.tick(len(X) * numEpochs)
+  finally:
+    # Also stores them for the checkpoints of an interrupted run
+    saveModelStats([CHECKPOINT_PATH, BEST_CHECKPOINT_PATH], trainingStart, cachePath)
+
+def trainArtToPrimaryTypeModelPrefetched(artPath, jsonPath, testProp, numEpochs=50,
+                                          chunkSize=2048, maxChunks=2, numWorkers=2,
+                                          augmentor=None, seed=None):
+  '''
+  Trains a convolutional network to categorize card art by primary type, feeding it chunks decoded
+    by background workers instead of decoding the whole art set up front. Peak memory is bounded
+    by the chunk size and the first chunk is ready after chunkSize decodes
+  Inputs:
+    artPath: path to card art
+    jsonPath: path to card data json file
+    testProp: proportion of samples to be used for test/validation
+    numEpochs: number of epochs to train for (50)
+    chunkSize: number of images per chunk, also caps the validation set size (2048)
+    maxChunks: number of decoded chunks waiting for the model at most (2)
+    numWorkers: number of background decode threads (2)
+    augmentor: function of a training chunk and a RandomState applied to every training chunk,
+      e.g. a BatchAugmentor (None)
+    seed: seed for the chunk order and augmentation, reproducible whatever the number of
+      workers (None)
+  '''
+  trainLoader, testLoader, numCategories = prefetchLoaderFromDirectory(
+    artPath, jsonPath, testProp=testProp, chunkSize=chunkSize, maxChunks=maxChunks,
+    numWorkers=numWorkers, augmentor=augmentor, seed=seed)
+  validationSet = testLoader.decodeChunk(np.arange(min(chunkSize, len(testLoader.files))))
+
+  # Train model as classifier, one chunk at a time
+  model = artToPrimaryTypeModel(numCategories)
+  trainingStart = time.time()
+  try:
+    with Stage('trainArtToPrimaryTypeModelPrefetched',
+                total=len(trainLoader.files) * numEpochs) as stage:
+      for epoch in range(numEpochs):
+        for X, Y in trainLoader:
+          with stage.step('fitChunk'):
+            model.fit(X, Y, n_epoch=1, shuffle=True, show_metric=True, batch_size=100,
+                        run_id='mtg_classifier')
+          stage.tick(len(X))
+        # Validated once per epoch rather than after every chunk
+        with stage.step('validate'):
+          accuracy = model.evaluate(validationSet[0], validationSet[1], batch_size=100)
+        logger.info('Epoch %d validation accuracy: %s', epoch + 1, accuracy)
+  finally:
+    saveModelStats([CHECKPOINT_PATH, BEST_CHECKPOINT_PATH], trainingStart)
+
+def startSampler(modelPath, maxLength, charIdx, seed, temperatures, length, epoch, logPath):
+  '''
+  Starts sampling.py in a new python process to log samples from a saved generator model. A fresh
+    interpreter runs the sampler, so the training script is not imported again and needs no
+    __main__ guard, and the child does not share the live TensorFlow session
+  Inputs:
+    same as sampling.sampleFromCheckpoint
+  Outputs:
+    process: subprocess.Popen of the sampler
+  '''
+  argsPath = os.path.abspath(modelPath) + '.sample.json'
+  with io.open(argsPath, 'w', encoding='utf-8') as argsFile:
+    argsFile.write(json.dumps({'modelPath': os.path.abspath(modelPath), 'maxLength': maxLength,
+                                'charIdx': charIdx, 'seed': seed, 'temperatures': temperatures,
+                                'length': length, 'epoch': epoch,
+                                'logPath': os.path.abspath(logPath) if logPath else None}))
+  return subprocess.Popen([sys.executable, os.path.abspath(sampling.__file__), argsPath])
 
-def trainTypeSubtypeNameGenerator(jsonPath, testProp, maxLength, numEpochs=50):
+def trainTypeSubtypeNameGenerator(jsonPath, testProp, maxLength, numEpochs=50, chunkSize=None,
+                                    sampleEvery=1, sampleInBackground=False, sampleLogPath=None,
+                                    sampleModelPath='./generator_sample_model'):
   '''
   Trains a recurrent network to generate card types, subtypes, and names
   Inputs:
@@ -35,18 +155,64 @@ def trainTypeSubtypeNameGenerator(jsonPath, testProp, maxLength, numEpochs=50):
     testProp: proportion of samples to be used for test/validation
     maxLength: the maximum length of a single generated sample
     numEpochs: number of epochs to train for (50)
+    chunkSize: number of sequences to build onehot arrays for at a time, bounding memory use, if
+      None every sequence is built up front (None). Chunked training holds out a fixed testProp
+      of the sequences and evaluates them once per epoch
+    sampleEvery: number of epochs between test samples, 0 for no samples (1)
+    sampleInBackground: boolean for whether samples are generated from a saved copy of the model
+      by a separate python process while training continues, a sample is skipped and logged if
+      the previous one is still running (False)
+    sampleLogPath: file to append samples to, if None samples are printed (None)
+    sampleModelPath: path the model is saved to for background sampling
+      ('./generator_sample_model')
   '''
-  (X, Y, charIndex), totalString = simpleGenerateTypeSubtypeToNameInputs(jsonPath, maxLength)
+  if chunkSize:
+    sequences, totalString = simpleGenerateTypeSubtypeToNameSequences(jsonPath, maxLength)
+    charIndex = sequences.charIdx
+    # Held out once, so no sequence is validated in one epoch and trained on in another
+    order = np.random.permutation(len(sequences))
+    numTest = int(len(sequences) * testProp)
+    testIndices, trainIndices = order[:numTest], order[numTest:]
+  else:
+    (X, Y, charIndex), totalString = simpleGenerateTypeSubtypeToNameInputs(jsonPath, maxLength)
 
   model = typeSubtypeNameGeneratorModel(maxLength, charIndex)
-  
-  for i in range(numEpochs):
-    randomIndex = random.randint(0, len(totalString) -  maxLength - 1)
-    seed = totalString[randomIndex:randomIndex + maxLength]
-    model.fit(X, Y, validation_set=testProp, batch_size=128, n_epoch=1, show_metric=True,
-                run_id='typeSubtypeName')
-    print("-- TESTING...")
-    print("-- Test with temperature of 1.0 --")
-    print(model.generate(600, temperature=1.0, seq_seed=seed))
-    print("-- Test with temperature of 0.5 --")
-    print(model.generate(600, temperature=0.5, seq_seed=seed))
+  temperatures = [1.0, 0.5]
+  sampler = None
+
+  with Stage('trainTypeSubtypeNameGenerator', total=numEpochs) as stage:
+    for i in range(numEpochs):
+      randomIndex = random.randint(0, len(totalString) -  maxLength - 1)
+      seed = totalString[randomIndex:randomIndex + maxLength]
+      with stage.step('fit'):
+        if chunkSize:
+          for X, Y in sequences.iterBatches(chunkSize, indices=trainIndices):
+            model.fit(X, Y, batch_size=128, n_epoch=1, show_metric=True,
+                        run_id='typeSubtypeName')
+        else:
+          model.fit(X, Y, validation_set=testProp, batch_size=128, n_epoch=1, show_metric=True,
+                      run_id='typeSubtypeName')
+      if chunkSize and numTest:
+        with stage.step('validate'):
+          accuracy = 0.0
+          for X, Y in sequences.iterBatches(chunkSize, shuffle=False, indices=testIndices):
+            accuracy += model.evaluate(X, Y, batch_size=128)[0] * len(X)
+        logger.info('Epoch %d validation accuracy: %s', i + 1, accuracy / numTest)
+      sampleThisEpoch = sampleEvery and (i + 1) % sampleEvery == 0
+      if sampleThisEpoch and sampleInBackground:
+        if sampler is None or sampler.poll() is not None:
+          with stage.step('saveForSample'):
+            model.save(sampleModelPath)
+          sampler = startSampler(sampleModelPath, maxLength, charIndex, seed, temperatures, 600,
+                                  i + 1, sampleLogPath)
+        else:
+          logger.info('Skipping the sample of epoch %d, the previous sample is still running',
+                        i + 1)
+      elif sampleThisEpoch:
+        with stage.step('sample'):
+          samples = generateBatch(model, charIndex, maxLength, [seed] * len(temperatures),
+                                    temperatures, 600)
+          writeSamples(samples, temperatures, i + 1, sampleLogPath)
+      stage.tick()
+  if sampler is not None:
+    sampler.wait()
@@ -1,13 +1,21 @@
-from os import listdir
 from PIL import Image
 import random
-import io
-import json
 import numpy as np
 
-from tflearn.data_utils import string_to_semi_redundant_sequences
+from extraction import extractArt
+from instrumentation import Stage
+from artCache import openArtCache
+from artRecords import ArtRecords, loadArtRecords
+from artDedup import artClusters, selectDuplicates
+from cardTable import loadCardTable, primaryTypeCategories
+from scanManifest import buildScanManifest
+from sequences import SemiRedundantSequences
+from corpus import buildCorpus, buildCorpusShards, readCorpusShards, typeSubtypeNameEntry
 
-def generatePics(cardsPath, artPath='art', image_width=64, image_height=None, proportion=1):
+
+def generatePics(cardsPath, artPath='art', image_width=64, image_height=None, proportion=1,
+                  numWorkers=1, resume=False, decode='full', incremental=False,
+                  resolutions=None, grayscaleCopies=False):
   '''
   Creates images of the artwork section of magic the gathering cards
   Inputs:
@@ -16,28 +24,18 @@ def generatePics(cardsPath, artPath='art', image_width=64, image_height=None, pr
     image_width: width in pixels of final artwork (64)
     image_height: height in pixel of final artwork, if None will be set to image_width (None)
     proportion: proportion of cards to create artwork for, for testing (1)
+    numWorkers: number of worker processes to extract artwork with (1)
+    resume: boolean for whether to skip scans whose artwork already exists (False)
+    decode: 'full' or 'draft', 'draft' decodes jpeg scans at reduced resolution ('full')
+    incremental: boolean for whether to only process scans that are new or changed since the last
+      incremental run and remove the artwork of deleted scans (False)
+    resolutions: list of widths or (width, height) pairs to make from one decode of every scan,
+      each stored in a subdirectory of artPath found with artResolutionPath (None)
+    grayscaleCopies: boolean for whether to also store a grayscale copy of every resolution (False)
   '''
-  if not image_height:
-    image_height = image_width
-
-  cards = listdir(cardsPath)
-  print('Generating Card Art')
-  for index, cardPath in enumerate(cards):
-    if cardPath == '.DS_Store' or not random.random() < proportion :
-      continue
-    card = Image.open(cardsPath + cardPath)
-    width, height = card.size
-    artWidth, artHeight = (width * 0.76, height * 0.42)
-    widthBorder = (width - artWidth) / 2
-    heightBorder = widthBorder * 1.5
-    art = card.crop((widthBorder, heightBorder, widthBorder + artWidth, heightBorder + artHeight))
-    squareBorder = (artWidth - artHeight) / 2
-    art = art.crop((squareBorder, 0, squareBorder + artHeight, artHeight))
-    art = art.resize((image_width, image_height))
-    art.save(cardsPath + '../' + artPath + '/' + cardPath)
-    if int((index / len(cards)) * 10000) % 10 == 0:
-      print ("Percent done: %2.1f %%" % ((index / len(cards)) * 100))
-  print('Done')
+  extractArt(cardsPath, artPath=artPath, image_width=image_width, image_height=image_height,
+              proportion=proportion, numWorkers=numWorkers, resume=resume, decode=decode,
+              incremental=incremental, resolutions=resolutions, grayscaleCopies=grayscaleCopies)
 
 def generateCardToSimpleTypeDict(jsonPath, cutoffSize=100):
   '''
@@ -50,53 +48,15 @@ def generateCardToSimpleTypeDict(jsonPath, cutoffSize=100):
     cardNameToCategoreis: dictionary from card names to the appropriate category of types
     numCategories: the total number of represented categories, not including the "other" category
   '''
-  jsonFile = io.open(jsonPath)
-  cardData = json.load(jsonFile)
-
-  numOfType = {}
-
-  for cardName in cardData.keys():
-    if 'types' in cardData[cardName]:
-      if not cardData[cardName]['types'][0] in numOfType:
-        numOfType[cardData[cardName]['types'][0]] = 0
-      numOfType[cardData[cardName]['types'][0]]+=1
-
-  typeToCategory = {}
-  numCategories = 0
-
-  for type in numOfType:
-    if numOfType[type] > cutoffSize:
-      typeToCategory[type] = numCategories
-      numCategories+=1
-  typeToCategory['Other'] = numCategories
-  numCategories+=1
-
-  cardNameToCategories = {}
-
-  for cardName in cardData.keys():
-    category = typeToCategory['Other']
-    if 'types' in cardData[cardName]:
-      if cardData[cardName]['types'][0] in typeToCategory:
-        category = typeToCategory[cardData[cardName]['types'][0]]
-    cardNameToCategories[cardName] = category
+  table = loadCardTable(jsonPath)
+  categories, typeToCategory = primaryTypeCategories(table, cutoffSize)
+  numCategories = len(typeToCategory)
+  cardNameToCategories = dict(zip(table.names(), categories.tolist()))
 
   return (cardNameToCategories, numCategories, typeToCategory)
 
-def representsInt(s):
-  '''
-  Returns True if the passed in string represents an int, False otherwise
-  Inputs:
-    s: string to check
-  Outputs:
-    True or False depending on int representation
-  '''
-  try: 
-      int(s)
-      return True
-  except ValueError:
-      return False
-
-def turnPicsToSimpleInputs(artPath, jsonPath, cutoffSize=500, testProp=0.2):
+def turnPicsToSimpleInputs(artPath, jsonPath, cutoffSize=500, testProp=0.2, recordsPath=None,
+                            duplicates=None):
   '''
   Turns card artwork into array representation and pairs each card with its onehot primary type
     encoding, separating training and test/validation sets
@@ -105,6 +65,10 @@ def turnPicsToSimpleInputs(artPath, jsonPath, cutoffSize=500, testProp=0.2):
     jsonPath: path to card info json file
     cutoffSize: minimum representaiton for at ype to be valid (500)
     testProp: proportion of art to separate from traingin for test/validation (0.2)
+    recordsPath: directory of packed art records to read instead of artPath (None)
+    duplicates: handling of near-duplicate art found by artClusters, None keeps every file,
+      'keepOne' keeps one file per cluster and 'splitByCluster' keeps every cluster on one side of
+      the split so duplicates cannot leak between training and test (None)
   Output:
     X: training art arrays
     Y: training category targets
@@ -112,6 +76,9 @@ def turnPicsToSimpleInputs(artPath, jsonPath, cutoffSize=500, testProp=0.2):
     Y_Test: testing category targets
     numCategories: total number of valid categories
   '''
+  if recordsPath:
+    return loadArtRecords(recordsPath, testProp)
+
   cardNameToCategories, numCategories, typeToCategory = generateCardToSimpleTypeDict(jsonPath, cutoffSize)
 
   X = []
@@ -119,35 +86,31 @@ def turnPicsToSimpleInputs(artPath, jsonPath, cutoffSize=500, testProp=0.2):
   X_Test = []
   Y_Test = []
 
-  artFiles = listdir(artPath)
-  print('Generating Art Inputs')
-  for index, art in enumerate(artFiles):
-    if art == '.DS_Store':
-      continue
-    fileParts = art.split('.')
-    if(representsInt(fileParts[0])):
-      fileParts.pop(0)
-    if fileParts[0][-1] == ' ':
-      fileParts[0] = fileParts[0][:-1]
-    if not fileParts[0] in cardNameToCategories:
-      cardNameToCategories[fileParts[0]] = typeToCategory['Other']
-    artPic = Image.open(artPath + art)
-    artArray = np.array(artPic, dtype='float64')
-    artData = artArray
-    if random.random() < testProp:
-      X_Test.append(artData)
-      Y_Test.append(cardNameToCategories[fileParts[0]])
-    else:
-      X.append(artData)
-      Y.append(cardNameToCategories[fileParts[0]])
-    if int((index / len(artFiles)) * 10000) % 10 == 0:
-      print ("Percent done: %2.1f %%" % ((index / len(artFiles)) * 100))
-  print('Done')
+  manifest = buildScanManifest(artPath, jsonPath)
+  artFiles = list(manifest)
+  fileToCluster = artClusters(artPath) if duplicates else None
+  artFiles, isTest = selectDuplicates(artFiles, fileToCluster, duplicates, testProp, random.random)
+  with Stage('turnPicsToSimpleInputs', total=len(artFiles)) as stage:
+    for art, testArt in zip(artFiles, isTest):
+      cardName = manifest[art]['name']
+      if not cardName in cardNameToCategories:
+        cardNameToCategories[cardName] = typeToCategory['Other']
+      with stage.step('decode'):
+        artPic = Image.open(artPath + art)
+        artArray = np.array(artPic, dtype='float64')
+      artData = artArray
+      if testArt:
+        X_Test.append(artData)
+        Y_Test.append(cardNameToCategories[cardName])
+      else:
+        X.append(artData)
+        Y.append(cardNameToCategories[cardName])
+      stage.tick()
   
   return (X,Y), (X_Test, Y_Test), numCategories
 
 def getLiveDemoPicsToInput(artPath, cardPath, jsonPath, cutoffSize=500, numDesired=10,
-                            showPics=False):
+                            showPics=False, cachePath=None, recordsPath=None):
   '''
   Creates the data subset for a live demo of the convolutional network
   Inputs:
@@ -157,6 +120,8 @@ def getLiveDemoPicsToInput(artPath, cardPath, jsonPath, cutoffSize=500, numDesir
     cutoffSize: minimum representation for a primary type to be valid (500)
     numDesired: size of demo subset (10)
     showPics: boolean of whether or not to open card art/scans (False)
+    cachePath: directory of a memory-mapped art cache to sample from instead of artPath (None)
+    recordsPath: directory of packed art records to sample from instead of artPath (None)
   Outputs:
     inputNames: array of names of cards in subset
     inputs: array representation of card art in subset
@@ -164,40 +129,117 @@ def getLiveDemoPicsToInput(artPath, cardPath, jsonPath, cutoffSize=500, numDesir
     categoryToType: map from category number to correct type
     cardNameToCategories: map from card name to category
   '''
+  if cachePath:
+    return getCachedLiveDemoPicsToInput(cachePath, artPath, cardPath, numDesired, showPics)
+  if recordsPath:
+    return getRecordsLiveDemoPicsToInput(recordsPath, artPath, cardPath, numDesired, showPics)
+
   cardNameToCategories, numCategories, typeToCategory = generateCardToSimpleTypeDict(jsonPath,
                                                                                       cutoffSize)
   inputNames = []
   inputs = []
   
-  artFiles = listdir(artPath)
-  subset = random.sample(artFiles, numDesired)
-  print('Generating Live Demo Input Subset')
-  for index, art in enumerate(subset):
-    if art == '.DS_Store':
-      continue
-    fileParts = art.split('.')
-    if(representsInt(fileParts[0])):
-      fileParts.pop(0)
-    if fileParts[0][-1] == ' ':
-      fileParts[0] = fileParts[0][:-1]
-    if not fileParts[0] in cardNameToCategories:
-      cardNameToCategories[fileParts[0]] = typeToCategory['Other']
-    artPic = Image.open(artPath + art)
-    artArray = np.array(artPic, dtype='float64')
-    artData = artArray
-    inputNames.append(fileParts[0])
-    inputs.append(artData)
-    if showPics:
-      cardPic = Image.open(cardPath + art)
-      cardPic.show()
-      artPic.show()
-    if int((index / numDesired) * 10000) % 10 == 0:
-      print ("Percent done: %2.1f %%" % ((index / numDesired) * 100))
-  print('Done')
+  manifest = buildScanManifest(artPath, jsonPath)
+  subset = random.sample(list(manifest), numDesired)
+  with Stage('getLiveDemoPicsToInput', total=numDesired) as stage:
+    for art in subset:
+      cardName = manifest[art]['name']
+      if not cardName in cardNameToCategories:
+        cardNameToCategories[cardName] = typeToCategory['Other']
+      with stage.step('decode'):
+        artPic = Image.open(artPath + art)
+        artArray = np.array(artPic, dtype='float64')
+      artData = artArray
+      inputNames.append(cardName)
+      inputs.append(artData)
+      if showPics:
+        cardPic = Image.open(cardPath + art)
+        cardPic.show()
+        artPic.show()
+      stage.tick()
 
   categoryToType = dict((v,k) for k,v in typeToCategory.items())
   return inputNames, inputs, numCategories, categoryToType, cardNameToCategories
 
+def getCachedLiveDemoPicsToInput(cachePath, artPath, cardPath, numDesired=10, showPics=False):
+  '''
+  Creates the data subset for a live demo from a memory-mapped art cache, only the sampled images
+    are read from disk
+  Inputs:
+    cachePath: directory of the art cache
+    artPath: path to card art, used when showing pictures
+    cardPath: path to card scans, used when showing pictures
+    numDesired: size of demo subset (10)
+    showPics: boolean of whether or not to open card art/scans (False)
+  Outputs:
+    same as getLiveDemoPicsToInput
+  '''
+  images, labels, names, files, meta = openArtCache(cachePath)
+  subset = np.sort(np.random.choice(len(images), numDesired, replace=False))
+
+  inputNames = [names[index] for index in subset]
+  inputs = list(np.asarray(images[subset], dtype='float64'))
+  cardNameToCategories = dict((names[index], int(labels[index])) for index in subset)
+  if showPics:
+    for index in subset:
+      Image.open(cardPath + files[index]).show()
+      Image.open(artPath + files[index]).show()
+
+  categoryToType = dict((v,k) for k,v in meta['typeToCategory'].items())
+  return inputNames, inputs, meta['numCategories'], categoryToType, cardNameToCategories
+
+def getRecordsLiveDemoPicsToInput(recordsPath, artPath, cardPath, numDesired=10,
+                                    showPics=False):
+  '''
+  Creates the data subset for a live demo from packed art records, fetching only the sampled
+    cards' records by name
+  Inputs:
+    recordsPath: directory of the art records
+    artPath: path to card art, used when showing pictures
+    cardPath: path to card scans, used when showing pictures
+    numDesired: size of demo subset (10)
+    showPics: boolean of whether or not to open card art/scans (False)
+  Outputs:
+    same as getLiveDemoPicsToInput
+  '''
+  artRecords = ArtRecords(recordsPath)
+  inputNames = random.sample(sorted(artRecords.nameToRecords), numDesired)
+  inputs = []
+  cardNameToCategories = {}
+  with Stage('getRecordsLiveDemoPicsToInput', total=numDesired) as stage:
+    for cardName in inputNames:
+      # Only the card's first record is read, not its flipped or blurred copies
+      record = artRecords.nameToRecords[cardName][0]
+      with stage.step('fetch'):
+        image = artRecords.readRecord(record)
+      art = artRecords.files[record]
+      inputs.append(np.asarray(image, dtype='float64'))
+      cardNameToCategories[cardName] = int(artRecords.labels[record])
+      if showPics:
+        Image.open(cardPath + art).show()
+        Image.fromarray(image).show()
+      stage.tick()
+
+  meta = artRecords.meta
+  categoryToType = dict((v,k) for k,v in meta['typeToCategory'].items())
+  return inputNames, inputs, meta['numCategories'], categoryToType, cardNameToCategories
+
+def generateTypeSubtypeToNameString(jsonPath, corpusPath=None):
+  '''
+  Generates the complete training string for type, subtype, name generation
+  Inputs:
+    jsonPath: path to card data json file
+    corpusPath: directory to keep a sharded copy of the string in, only changed shards are
+      rewritten on later calls (None)
+  Outputs:
+    totalString: the complete string of card data, each line of which has the format
+      'type1,type2;subtype1,subtype2;name'
+  '''
+  if corpusPath:
+    buildCorpusShards(jsonPath, corpusPath, typeSubtypeNameEntry)
+    return readCorpusShards(corpusPath)
+  return buildCorpus(jsonPath, typeSubtypeNameEntry)
+
 def simpleGenerateTypeSubtypeToNameInputs(jsonPath, maxLength=75):
   '''
   Generates input sequences for type, subtype, name generation
@@ -211,25 +253,22 @@ def simpleGenerateTypeSubtypeToNameInputs(jsonPath, maxLength=75):
     totalString: the complete string of card data, each line of which has the format
       'type1,type2;subtype1,subtype2;name'
   '''
-  jsonFile = io.open(jsonPath)
-  cardData = json.load(jsonFile)
-
-  totalString = ''
-
-  for cardName in cardData.keys():
-    element = ''
-    if 'types' in cardData[cardName]:
-      for type in cardData[cardName]['types']:
-        element+=type
-        element+=','
-      element= element[:-1] + ';'
-    if 'subtypes' in cardData[cardName]:
-      for subtype in cardData[cardName]['subtypes']:
-        element+=subtype
-        element+=','
-      element = element[:-1] + ';'
-    element+=cardName
-    totalString+=element 
-    totalString+='\n\n'
+  from tflearn.data_utils import string_to_semi_redundant_sequences
 
+  totalString = generateTypeSubtypeToNameString(jsonPath)
   return string_to_semi_redundant_sequences(totalString, maxLength), totalString
+
+def simpleGenerateTypeSubtypeToNameSequences(jsonPath, maxLength=75):
+  '''
+  Generates a lazy source of input sequences for type, subtype, name generation, which only
+    builds onehot batches on demand
+  Inputs:
+    jsonPath: path to card data json file
+    maxLength: maximum length for a sequence (75)
+  Outputs:
+    sequences: SemiRedundantSequences over the complete string, sequences.charIdx holds the map
+      from chars to their ids in the encoding
+    totalString: the complete string of card data
+  '''
+  totalString = generateTypeSubtypeToNameString(jsonPath)
+  return SemiRedundantSequences(totalString, maxLength), totalString